@@ -0,0 +1,197 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import generator
+import solution
+
+SIZE_LIST = [10000, 1000000, 10000000]
+# generator options of each dataset
+DATASET_DICT = {
+    'clean': {},
+    'dirty': {'invalid_rate': 0.05},
+    'duplicate': {'duplicate_rate': 0.3}
+}
+
+
+def peak_rss() -> int:
+    # peak resident set size of this process in bytes, ru_maxrss is in kilobytes on linux and bytes on macos. None
+    # where the resource module does not exist, such as windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss() -> bool:
+    # linux sets the peak resident set size back to the current one when 5 is written to clear_refs, other systems
+    # only have the peak of the whole process
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def status_rss(field: str) -> int:
+    # VmRSS (current) or VmHWM (peak since the last reset) of /proc/self/status in bytes
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def time_stage(stage_list: list, stage: str, rows_in: int, function, *args):
+    # run one stage and record its wall and cpu time, row counts, throughput and memory. rows_in is None when the
+    # stage produces its rows, like reading the file. peak_rss is the peak of this stage only and peak_rss_delta
+    # how far it rose above the rss the stage started with, both None when the peak can not be reset
+    peak_reset = reset_peak_rss()
+    rss_start = status_rss('VmRSS') if peak_reset else None
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = function(*args)
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    stage_peak_rss = status_rss('VmHWM') if peak_reset else None
+    rows_in = len(result) if rows_in is None else rows_in
+    stage_list.append({
+        'stage': stage,
+        'wall_time': wall_time,
+        'cpu_time': cpu_time,
+        'rows_in': rows_in,
+        'rows_out': len(result),
+        'rows_per_second': rows_in / wall_time if wall_time > 0 else None,
+        'peak_rss': stage_peak_rss,
+        'peak_rss_delta': stage_peak_rss - rss_start if peak_reset else None
+    })
+    return result
+
+
+def benchmark_file(csvfile: str) -> list:
+    # time each stage of solution.main on csvfile
+    stage_list = []
+    read_data = time_stage(stage_list, 'read_file', None, solution.read_file, csvfile)
+    stage_list[-1]['megabytes_per_second'] = os.path.getsize(csvfile) / stage_list[-1]['wall_time'] / 1e6
+    data_list = time_stage(stage_list, 'save_file_data', len(read_data) - 1, solution.save_file_data, read_data,
+                           solution.RejectionReport())
+    del read_data
+    country_data_dict = time_stage(stage_list, 'save_data_in_dict country', len(data_list),
+                                   solution.save_data_in_dict, data_list, 'country')
+    time_stage(stage_list, 't_test_score_minkowski_distance', len(data_list),
+               solution.t_test_score_minkowski_distance, country_data_dict)
+    del country_data_dict
+    category_data_dict = time_stage(stage_list, 'save_data_in_dict category', len(data_list),
+                                    solution.save_data_in_dict, data_list, 'category')
+    time_stage(stage_list, 'category_dictionary', len(data_list), solution.category_dictionary, category_data_dict)
+    return stage_list
+
+
+def run_case(case_args: tuple) -> dict:
+    size, dataset, csvfile = case_args
+    wall_start = time.perf_counter()
+    stage_list = benchmark_file(csvfile)
+    # resetting the peak for each stage resets the process peak as well, the case peak is then the largest stage peak
+    stage_peak_list = [x['peak_rss'] for x in stage_list if x['peak_rss'] is not None]
+    return {
+        'size': size,
+        'dataset': dataset,
+        'file_size': os.path.getsize(csvfile),
+        'wall_time': time.perf_counter() - wall_start,
+        'peak_rss': max(stage_peak_list) if len(stage_peak_list) > 0 else peak_rss(),
+        'stage_list': stage_list
+    }
+
+
+def data_file(data_dir: str, size: int, dataset: str, seed: int) -> str:
+    # generated files are kept in data_dir and reused by later runs
+    csvfile = os.path.join(data_dir, "{}_{}_{}.csv".format(dataset, size, seed))
+    if not os.path.exists(csvfile):
+        temp_file = "{}.{}.tmp".format(csvfile, os.getpid())
+        generator.generate_csv(temp_file, size, seed=seed, workers=os.cpu_count(), **DATASET_DICT[dataset])
+        os.replace(temp_file, csvfile)
+    return csvfile
+
+
+def run_benchmark(size_list: list = None, dataset_list: list = None, data_dir: str = "./benchmark_data",
+                  seed: int = 0) -> dict:
+    # every case runs in a fresh process, so its peak rss only covers that case
+    size_list = SIZE_LIST if size_list is None else size_list
+    dataset_list = list(DATASET_DICT) if dataset_list is None else dataset_list
+    os.makedirs(data_dir, exist_ok=True)
+    case_list = []
+    for size in size_list:
+        for dataset in dataset_list:
+            csvfile = data_file(data_dir, size, dataset, seed)
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                case = executor.submit(run_case, (size, dataset, csvfile)).result()
+            print("size:[{}] dataset:[{}] wall time:[{:.3f}s] peak rss:[{}]".format(
+                size, dataset, case['wall_time'],
+                "unknown" if case['peak_rss'] is None else "{:.1f}MB".format(case['peak_rss'] / 1e6)))
+            case_list.append(case)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'case_list': case_list
+    }
+
+
+def compare_result(baseline: dict, current: dict, tolerance: float = 0.1) -> list:
+    # stages whose wall time or memory rise grew by more than tolerance against the baseline, and cases whose peak
+    # rss did. a metric missing on either side is not compared
+    baseline_dict = {(case['size'], case['dataset'], stage['stage']): stage
+                     for case in baseline['case_list'] for stage in case['stage_list']}
+    baseline_dict.update({(case['size'], case['dataset'], 'case'): case for case in baseline['case_list']})
+    regression_list = []
+    for case in current['case_list']:
+        metric_list = [(stage, ('wall_time', 'peak_rss_delta')) for stage in case['stage_list']]
+        metric_list.append((dict(case, stage='case'), ('peak_rss',)))
+        for stage, stage_metric_list in metric_list:
+            baseline_stage = baseline_dict.get((case['size'], case['dataset'], stage['stage']))
+            if baseline_stage is None:
+                continue
+            for metric in stage_metric_list:
+                if stage.get(metric) is None or baseline_stage.get(metric) is None:
+                    continue
+                if stage[metric] > baseline_stage[metric] * (1 + tolerance):
+                    regression_list.append({'size': case['size'], 'dataset': case['dataset'],
+                                            'stage': stage['stage'], 'metric': metric,
+                                            'baseline': baseline_stage[metric], 'current': stage[metric]})
+    return regression_list
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmark the stages of solution.main")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZE_LIST)
+    parser.add_argument('--datasets', nargs='+', choices=list(DATASET_DICT), default=list(DATASET_DICT))
+    parser.add_argument('--data-dir', default="./benchmark_data")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default="./benchmark.json")
+    parser.add_argument('--baseline', help="earlier output file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+    result = run_benchmark(args.sizes, args.datasets, args.data_dir, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regression_list = compare_result(json.load(f), result, args.tolerance)
+        for regression in regression_list:
+            print("Regression size:[{}] dataset:[{}] stage:[{}] {}:[{}] -> [{}]".format(
+                regression['size'], regression['dataset'], regression['stage'], regression['metric'],
+                regression['baseline'], regression['current']))
+        sys.exit(1 if len(regression_list) > 0 else 0)
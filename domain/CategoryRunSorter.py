@@ -0,0 +1,110 @@
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from itertools import islice
+
+# estimated bytes of one buffered organisation, a tuple of two strings, an int and two floats
+ITEM_SIZE = 300
+# file buffer of each run file, a merge holds one per run it reads
+RUN_BUFFER_SIZE = 4096
+# fewer runs are merged at once rather than reading each of them in blocks smaller than this
+MIN_BLOCK_SIZE = 16
+
+
+class CategoryRunSorter:
+
+    def __init__(self, memory_size=256 * 1024 * 1024, temp_dir=None, fan_in=64):
+        # organisations are buffered until memory_size is used, then sorted and spilled to a run file. items are
+        # (category, -number of employees, -profit percent change, sequence, organisation id) so the natural order
+        # is the rank order within each category, with the file order breaking ties
+        self.run_size = max(1, memory_size // ITEM_SIZE)
+        self.buffer = []
+        self.sequence = 0
+        self.run_file_list = []
+        self.run_count = 0
+        self.temp_dir = tempfile.mkdtemp(prefix="category_run_", dir=temp_dir)
+        # at most fan_in run files are merged at once, each read block_size items at a time. a merge holds a file
+        # buffer and a block for every run it reads and a block of its output, fan_in is lowered until that fits in
+        # memory_size
+        self.fan_in = max(2, min(fan_in, memory_size // (RUN_BUFFER_SIZE + MIN_BLOCK_SIZE * ITEM_SIZE) - 1))
+        self.block_size = max(1, (memory_size // (self.fan_in + 1) - RUN_BUFFER_SIZE) // ITEM_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, category, organisation_id, number_of_employees, profit_percent_change):
+        self.buffer.append((category, -number_of_employees, -profit_percent_change, self.sequence, organisation_id))
+        self.sequence += 1
+        if len(self.buffer) >= self.run_size:
+            self.spill()
+
+    def spill(self):
+        if len(self.buffer) == 0:
+            return
+        self.buffer.sort()
+        self.run_file_list.append(self.write_run(iter(self.buffer)))
+        self.buffer = []
+
+    def write_run(self, item_iter):
+        # a run file is a sequence of pickled blocks of sorted items
+        run_file = os.path.join(self.temp_dir, "run_{}.pickle".format(self.run_count))
+        self.run_count += 1
+        with open(run_file, 'wb', buffering=RUN_BUFFER_SIZE) as f:
+            while True:
+                block = list(islice(item_iter, self.block_size))
+                if len(block) == 0:
+                    break
+                pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return run_file
+
+    def read_run(self, run_file):
+        with open(run_file, 'rb', buffering=RUN_BUFFER_SIZE) as f:
+            while True:
+                try:
+                    block = pickle.load(f)
+                except EOFError:
+                    return
+                yield from block
+
+    def iter_item(self):
+        # every item in order. a buffer that never filled up is sorted in memory, otherwise the runs are merged
+        # fan_in at a time until a single merge is left
+        if len(self.run_file_list) == 0:
+            self.buffer.sort()
+            yield from self.buffer
+            return
+        self.spill()
+        while len(self.run_file_list) > self.fan_in:
+            merge_list = self.run_file_list[:self.fan_in]
+            self.run_file_list = self.run_file_list[self.fan_in:] + [
+                self.write_run(heapq.merge(*[self.read_run(x) for x in merge_list]))]
+            for run_file in merge_list:
+                os.remove(run_file)
+        yield from heapq.merge(*[self.read_run(x) for x in self.run_file_list])
+
+    def iter_ranked(self, top_k=None):
+        # (category, organisation id, number of employees, profit percent change, rank) in category and rank order,
+        # rank starts from 1 in each category
+        category = None
+        rank = 0
+        for item in self.iter_item():
+            if item[0] != category:
+                category = item[0]
+                rank = 0
+            rank += 1
+            if top_k is None or rank <= top_k:
+                yield item[0], item[4], -item[1], -item[2], rank
+
+    def get_run_count(self):
+        # run files written so far, merged runs included
+        return self.run_count
+
+    def close(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.run_file_list = []
+        self.buffer = []
@@ -0,0 +1,81 @@
+class CountryAccumulator:
+
+    def __init__(self, similarity=3):
+        self.similarity = similarity
+        self.count = 0
+        # running mean and sum of squared differences (Welford) for the profit columns
+        self.profit_2020_mean = 0.0
+        self.profit_2020_m2 = 0.0
+        self.profit_2021_mean = 0.0
+        self.profit_2021_m2 = 0.0
+        # running sum of |number of employees - median salary| ** similarity
+        self.distance_power_sum = 0
+
+    def add(self, number_of_employees, median_salary, profit_2020, profit_2021):
+        self.count += 1
+        delta = profit_2020 - self.profit_2020_mean
+        self.profit_2020_mean += delta / self.count
+        self.profit_2020_m2 += delta * (profit_2020 - self.profit_2020_mean)
+        delta = profit_2021 - self.profit_2021_mean
+        self.profit_2021_mean += delta / self.count
+        self.profit_2021_m2 += delta * (profit_2021 - self.profit_2021_mean)
+        self.distance_power_sum += abs(number_of_employees - median_salary) ** self.similarity
+
+    def remove(self, number_of_employees, median_salary, profit_2020, profit_2021):
+        # reverse of add, used to retract an organisation
+        if self.count <= 1:
+            self.__init__(self.similarity)
+            return
+        self.count -= 1
+        delta = profit_2020 - self.profit_2020_mean
+        self.profit_2020_mean -= delta / self.count
+        self.profit_2020_m2 = max(self.profit_2020_m2 - delta * (profit_2020 - self.profit_2020_mean), 0.0)
+        delta = profit_2021 - self.profit_2021_mean
+        self.profit_2021_mean -= delta / self.count
+        self.profit_2021_m2 = max(self.profit_2021_m2 - delta * (profit_2021 - self.profit_2021_mean), 0.0)
+        self.distance_power_sum -= abs(number_of_employees - median_salary) ** self.similarity
+
+    def merge(self, other):
+        # combine two partial states (Chan et al.)
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.profit_2020_mean - self.profit_2020_mean
+        self.profit_2020_mean += delta * other.count / count
+        self.profit_2020_m2 += other.profit_2020_m2 + delta ** 2 * self.count * other.count / count
+        delta = other.profit_2021_mean - self.profit_2021_mean
+        self.profit_2021_mean += delta * other.count / count
+        self.profit_2021_m2 += other.profit_2021_m2 + delta ** 2 * self.count * other.count / count
+        self.distance_power_sum += other.distance_power_sum
+        self.count = count
+
+    def set_moments(self, count, profit_2020_mean, profit_2020_m2, profit_2021_mean, profit_2021_m2,
+                    distance_power_sum):
+        # state computed elsewhere, e.g. by a database aggregate
+        self.count = count
+        self.profit_2020_mean = profit_2020_mean
+        self.profit_2020_m2 = profit_2020_m2
+        self.profit_2021_mean = profit_2021_mean
+        self.profit_2021_m2 = profit_2021_m2
+        self.distance_power_sum = distance_power_sum
+
+    def get_count(self):
+        return self.count
+
+    def get_similarity(self):
+        return self.similarity
+
+    def get_profit_2020_mean(self):
+        return self.profit_2020_mean
+
+    def get_profit_2021_mean(self):
+        return self.profit_2021_mean
+
+    def get_profit_2020_variance(self):
+        return self.profit_2020_m2 / (self.count - 1) if self.count > 1 else 0
+
+    def get_profit_2021_variance(self):
+        return self.profit_2021_m2 / (self.count - 1) if self.count > 1 else 0
+
+    def get_distance_power_sum(self):
+        return self.distance_power_sum
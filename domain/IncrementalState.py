@@ -0,0 +1,95 @@
+from domain.CountryAccumulator import CountryAccumulator
+from domain.RankIndex import RankIndex
+from domain.RowValidator import RowValidator
+
+
+class IncrementalState:
+
+    def __init__(self, column_list, similarity=3):
+        self.column_list = column_list
+        self.similarity = similarity
+        self.reset()
+
+    def reset(self):
+        # forget every processed row, the next update reads the file from the start
+        # byte offset of the first row not processed yet
+        self.offset = 0
+        # fingerprint of the file bytes before offset, a different one means the file was replaced
+        self.fingerprint = None
+        # every organisation id seen so far, and those seen more than once
+        self.organisation_id_set = set()
+        self.organisation_duplicate_id_set = set()
+        # organisation id -> validated row, kept so that an organisation can be retracted
+        self.organisation_dict = {}
+        self.country_accumulator_dict = {}
+        # category -> RankIndex of its organisations
+        self.category_index_dict = {}
+        # groups changed since the last result, only those are recomputed
+        self.dirty_country_set = set()
+        self.dirty_category_set = set()
+        self.country_dict = {}
+        self.category_dict = {}
+
+    def add_fields(self, fields_iter, profit_percent_change, rejections=None):
+        # fields are in column_list order, profit_percent_change(profit_2020, profit_2021) gives the rounded change
+        validator = RowValidator(self.column_list, rejections)
+        for fields in fields_iter:
+            # every row is validated first, so invalid rows are reported whatever their organisation id
+            row = validator.validate(fields)
+            organisation_id = fields[0]
+            if organisation_id in self.organisation_duplicate_id_set:
+                if row is not None and rejections is not None:
+                    rejections.duplicate(fields)
+                continue
+            if organisation_id in self.organisation_id_set:
+                # the organisation becomes a duplicate, retract it from every group it was counted in
+                self.organisation_duplicate_id_set.add(organisation_id)
+                self.retract(organisation_id, rejections)
+                if row is not None and rejections is not None:
+                    rejections.duplicate(fields)
+                continue
+            self.organisation_id_set.add(organisation_id)
+            if row is None:
+                continue
+            (organisation_id, country, category, number_of_employees, median_salary, profit_2020, profit_2021) = row
+            self.organisation_dict[organisation_id] = row
+            if country not in self.country_accumulator_dict:
+                self.country_accumulator_dict[country] = CountryAccumulator(self.similarity)
+            self.country_accumulator_dict[country].add(number_of_employees, median_salary, profit_2020, profit_2021)
+            self.dirty_country_set.add(country)
+            if category not in self.category_index_dict:
+                self.category_index_dict[category] = RankIndex()
+            self.category_index_dict[category].insert(organisation_id, number_of_employees,
+                                                      profit_percent_change(profit_2020, profit_2021))
+            self.dirty_category_set.add(category)
+
+    def retract(self, organisation_id, rejections=None):
+        row = self.organisation_dict.pop(organisation_id, None)
+        if row is None:
+            return
+        # the organisation was counted as valid, it is reported once it turns out to be a duplicate
+        if rejections is not None:
+            rejections.duplicate(row)
+        (organisation_id, country, category, number_of_employees, median_salary, profit_2020, profit_2021) = row
+        accumulator = self.country_accumulator_dict[country]
+        accumulator.remove(number_of_employees, median_salary, profit_2020, profit_2021)
+        if accumulator.get_count() == 0:
+            del self.country_accumulator_dict[country]
+        self.dirty_country_set.add(country)
+        rank_index = self.category_index_dict[category]
+        rank_index.remove(organisation_id)
+        if len(rank_index) == 0:
+            del self.category_index_dict[category]
+        self.dirty_category_set.add(category)
+
+    def get_offset(self):
+        return self.offset
+
+    def set_offset(self, offset):
+        self.offset = offset
+
+    def get_fingerprint(self):
+        return self.fingerprint
+
+    def set_fingerprint(self, fingerprint):
+        self.fingerprint = fingerprint
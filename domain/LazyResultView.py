@@ -0,0 +1,31 @@
+from collections.abc import Mapping
+
+
+class LazyResultView(Mapping):
+
+    def __init__(self, group_dict, compute):
+        # group_dict maps each key to its rows, compute(rows) gives the result of one key
+        self.group_dict = group_dict
+        self.compute = compute
+        self.result_dict = {}
+
+    def __getitem__(self, key):
+        # computed on first access and then memoised
+        if key not in self.result_dict:
+            self.result_dict[key] = self.compute(self.group_dict[key])
+        return self.result_dict[key]
+
+    def __iter__(self):
+        return iter(self.group_dict)
+
+    def __len__(self):
+        return len(self.group_dict)
+
+    def __contains__(self, key):
+        return key in self.group_dict
+
+    def __repr__(self):
+        return "{}({} keys, {} computed)".format(type(self).__name__, len(self.group_dict), len(self.result_dict))
+
+    def get_computed_size(self):
+        return len(self.result_dict)
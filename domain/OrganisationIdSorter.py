@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from domain.OrganisationIdTable import OrganisationIdTable, encode_organisation_id
+
+# bytes of one id code
+CODE_SIZE = 8
+# file buffer of each run file, a merge holds one per run it reads
+RUN_BUFFER_SIZE = 4096
+# fewer runs are merged at once rather than reading each of them in blocks smaller than this
+MIN_BLOCK_SIZE = 1024
+
+
+class OrganisationIdSorter:
+
+    def __init__(self, memory_size=256 * 1024 * 1024, temp_dir=None, fan_in=64):
+        # duplicated organisation ids found by an external sort of the id codes. codes are buffered until
+        # memory_size is used, then sorted and spilled to a run file, and the runs are merged into a sorted file of
+        # the duplicated codes that is read through a memory map. ids that are not hex digits have no code and are
+        # counted in fallback_dict
+        self.run_size = max(1, memory_size // CODE_SIZE)
+        self.buffer = None
+        self.buffer_size = 0
+        self.run_file_list = []
+        self.run_count = 0
+        self.fallback_dict = {}
+        self.encoder = OrganisationIdTable(capacity=16)
+        self.temp_dir = tempfile.mkdtemp(prefix="organisation_id_run_", dir=temp_dir)
+        # a merge holds a file buffer and a block for every run it reads, the merged block and the copies taken to
+        # find its duplicates, about 5 codes per code read. fan_in is lowered until that fits in memory_size
+        self.fan_in = max(2, min(fan_in, memory_size // (RUN_BUFFER_SIZE + 5 * MIN_BLOCK_SIZE * CODE_SIZE)))
+        self.block_size = max(1, (memory_size // self.fan_in - RUN_BUFFER_SIZE) // (5 * CODE_SIZE))
+        self.duplicate_file = None
+        self.duplicate_code = np.zeros(0, dtype=np.uint64)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, organisation_id):
+        # whether the id is counted more than once, only valid after finish
+        code = encode_organisation_id(organisation_id)
+        if code == 0:
+            return self.fallback_dict.get(organisation_id, 0) > 1
+        code = np.uint64(code)
+        i = int(np.searchsorted(self.duplicate_code, code))
+        return i < len(self.duplicate_code) and self.duplicate_code[i] == code
+
+    def add_list(self, organisation_id_list):
+        code = self.encoder.encode(organisation_id_list)
+        for i in np.flatnonzero(code == 0).tolist():
+            organisation_id = organisation_id_list[i]
+            self.fallback_dict[organisation_id] = min(self.fallback_dict.get(organisation_id, 0) + 1, 2)
+        code = code[code != 0]
+        if self.buffer is None:
+            self.buffer = np.empty(self.run_size, dtype=np.uint64)
+        start = 0
+        while start < len(code):
+            size = min(len(code) - start, self.run_size - self.buffer_size)
+            self.buffer[self.buffer_size:self.buffer_size + size] = code[start:start + size]
+            self.buffer_size += size
+            start += size
+            if self.buffer_size == self.run_size:
+                self.spill()
+
+    def spill(self):
+        if self.buffer_size == 0:
+            return
+        run = self.buffer[:self.buffer_size]
+        run.sort()
+        self.run_file_list.append(self.write_run([run]))
+        self.buffer_size = 0
+
+    def write_run(self, block_iter, name="run"):
+        # a run file is the raw bytes of sorted codes
+        run_file = os.path.join(self.temp_dir, "{}_{}.bin".format(name, self.run_count))
+        self.run_count += 1
+        with open(run_file, 'wb', buffering=RUN_BUFFER_SIZE) as f:
+            for block in block_iter:
+                block.tofile(f)
+        return run_file
+
+    def read_block(self, f):
+        return np.frombuffer(f.read(self.block_size * CODE_SIZE), dtype=np.uint64)
+
+    def iter_merged(self, run_file_list):
+        # sorted blocks of every code of the runs. each step takes the codes up to the smallest last code of the
+        # current blocks, every code left in the runs is at least that large
+        file_list = [open(x, 'rb', buffering=RUN_BUFFER_SIZE) for x in run_file_list]
+        try:
+            block_list = [self.read_block(f) for f in file_list]
+            while True:
+                active_list = [i for i in range(len(block_list)) if len(block_list[i]) > 0]
+                if len(active_list) == 0:
+                    return
+                bound = min(block_list[i][-1] for i in active_list)
+                merged_list = []
+                for i in active_list:
+                    cut = int(np.searchsorted(block_list[i], bound, side='right'))
+                    merged_list.append(block_list[i][:cut])
+                    block_list[i] = block_list[i][cut:]
+                    if len(block_list[i]) == 0:
+                        block_list[i] = self.read_block(file_list[i])
+                merged = np.concatenate(merged_list)
+                del merged_list
+                merged.sort()
+                yield merged
+        finally:
+            for f in file_list:
+                f.close()
+
+    def iter_duplicate(self, block_iter):
+        # unique codes that appear more than once in the sorted blocks, a code may continue in the next block
+        previous = None
+        last_duplicate = None
+        for block in block_iter:
+            if len(block) == 0:
+                continue
+            same = block[1:] == block[:-1]
+            duplicate = np.zeros(len(block), dtype=bool)
+            duplicate[1:] |= same
+            duplicate[:-1] |= same
+            if previous is not None and block[0] == previous:
+                duplicate[0] = True
+            previous = block[-1]
+            code = np.unique(block[duplicate])
+            if len(code) > 0 and code[0] == last_duplicate:
+                code = code[1:]
+            if len(code) > 0:
+                last_duplicate = code[-1]
+                yield code
+
+    def finish(self):
+        # merge the runs fan_in at a time until a single merge is left, that one writes the duplicated codes
+        self.spill()
+        self.buffer = None
+        while len(self.run_file_list) > self.fan_in:
+            merge_list = self.run_file_list[:self.fan_in]
+            self.run_file_list = self.run_file_list[self.fan_in:] + [self.write_run(self.iter_merged(merge_list))]
+            for run_file in merge_list:
+                os.remove(run_file)
+        self.duplicate_file = self.write_run(self.iter_duplicate(self.iter_merged(self.run_file_list)), "duplicate")
+        for run_file in self.run_file_list:
+            os.remove(run_file)
+        self.run_file_list = []
+        if os.path.getsize(self.duplicate_file) > 0:
+            self.duplicate_code = np.memmap(self.duplicate_file, dtype=np.uint64, mode='r')
+
+    def get_duplicate_size(self):
+        return len(self.duplicate_code) + sum(1 for x in self.fallback_dict.values() if x > 1)
+
+    def get_run_count(self):
+        # run files written so far, merged runs and the duplicate file included
+        return self.run_count
+
+    def close(self):
+        # the memory map is dropped before its file is removed
+        self.duplicate_code = np.zeros(0, dtype=np.uint64)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.run_file_list = []
+        self.buffer = None
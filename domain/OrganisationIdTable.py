@@ -0,0 +1,192 @@
+import numpy as np
+
+# lowercase hex digit value of each ascii byte, 255 for any other byte
+HEX_VALUE = np.full(256, 255, dtype=np.uint8)
+HEX_VALUE[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10, dtype=np.uint8)
+HEX_VALUE[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16, dtype=np.uint8)
+HEX_LENGTH = 15
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+HEX_DIGIT_SET = frozenset('0123456789abcdef')
+
+
+def encode_organisation_id(organisation_id):
+    # code of a single id as OrganisationIdTable.encode gives it, without building arrays
+    if 0 < len(organisation_id) <= HEX_LENGTH and HEX_DIGIT_SET.issuperset(organisation_id):
+        return len(organisation_id) << 60 | int(organisation_id, 16)
+    return 0
+
+
+class OrganisationIdTable:
+
+    def __init__(self, capacity=1 << 16, bloom_size=0, bloom_hash_size=3):
+        # occurrence count of each organisation id. an id of 1 to 15 lowercase hex digits is encoded as the 64 bit
+        # integer length << 60 | value and kept in an open addressing table of such codes (0 is an empty slot), any
+        # other id is counted in fallback_dict. counts stop at 2, that is enough to tell duplicates apart
+        capacity = 1 << max(4, (capacity - 1).bit_length())
+        self.key = np.zeros(capacity, dtype=np.uint64)
+        self.count = np.zeros(capacity, dtype=np.uint8)
+        self.size = 0
+        self.fallback_dict = {}
+        # optional bloom filter of bloom_size bits in front of the table, a code missing from it is not probed for
+        self.bloom = np.zeros(-(-bloom_size // 8), dtype=np.uint8) if bloom_size > 0 else None
+        self.bloom_hash_size = bloom_hash_size
+
+    def __len__(self):
+        return self.size + len(self.fallback_dict)
+
+    def __contains__(self, organisation_id):
+        return self.get_count(organisation_id) > 0
+
+    def encode(self, organisation_id_list):
+        # codes of the ids, 0 for an id that is not 1 to 15 lowercase hex digits
+        try:
+            raw = np.array(organisation_id_list, dtype='S{}'.format(HEX_LENGTH + 1))
+        except UnicodeEncodeError:
+            return np.array([self.encode([x])[0] if x.isascii() else 0 for x in organisation_id_list],
+                            dtype=np.uint64)
+        # rows of 16 bytes, padded with 0 after the id
+        digits = raw.view(np.uint8).reshape(len(raw), HEX_LENGTH + 1)
+        length = (digits != 0).sum(axis=1)
+        value = HEX_VALUE[digits]
+        position = np.arange(HEX_LENGTH + 1)
+        valid = (length > 0) & (length <= HEX_LENGTH) & np.all((value != 255) | (position >= length[:, None]), axis=1)
+        code = np.zeros(len(raw), dtype=np.uint64)
+        for i in range(HEX_LENGTH):
+            code = np.where(i < length, (code << np.uint64(4)) | value[:, i].astype(np.uint64), code)
+        code |= length.astype(np.uint64) << np.uint64(60)
+        code[~valid] = 0
+        return code
+
+    def decode(self, code):
+        length = int(code) >> 60
+        return format(int(code) & ((1 << 60) - 1), '0{}x'.format(length))
+
+    def add_list(self, organisation_id_list):
+        # count every id of the list and return their codes
+        code = self.encode(organisation_id_list)
+        for i in np.flatnonzero(code == 0).tolist():
+            organisation_id = organisation_id_list[i]
+            self.fallback_dict[organisation_id] = min(self.fallback_dict.get(organisation_id, 0) + 1, 2)
+        self.add_code(code[code != 0])
+        return code
+
+    def add_code(self, code):
+        if len(code) == 0:
+            return
+        unique_code, unique_count = np.unique(code, return_counts=True)
+        if (self.size + len(unique_code)) * 2 > len(self.key):
+            self.resize((self.size + len(unique_code)) * 2)
+        slot = self.find(unique_code)
+        found = slot >= 0
+        self.count[slot[found]] = np.minimum(self.count[slot[found]] + np.minimum(unique_count[found], 2), 2)
+        self.insert(unique_code[~found], np.minimum(unique_count[~found], 2).astype(np.uint8))
+
+    def find(self, code):
+        # slot of each code, -1 when the code is not in the table. every code is probed at the same time
+        result = np.full(len(code), -1, dtype=np.int64)
+        pending = np.arange(len(code))
+        if self.bloom is not None:
+            pending = pending[self.bloom_contains(code)]
+        slot = self.hash(code[pending])
+        mask = np.uint64(len(self.key) - 1)
+        while len(pending) > 0:
+            key = self.key[slot.astype(np.int64)]
+            hit = key == code[pending]
+            result[pending[hit]] = slot[hit].astype(np.int64)
+            # an empty slot ends the probe sequence
+            probe = ~hit & (key != 0)
+            pending = pending[probe]
+            slot = (slot[probe] + np.uint64(1)) & mask
+        return result
+
+    def insert(self, code, count):
+        # codes are unique and not in the table yet. codes heading for the same empty slot take it one at a time,
+        # the others keep probing
+        if self.bloom is not None:
+            self.bloom_add(code)
+        slot = self.hash(code)
+        mask = np.uint64(len(self.key) - 1)
+        pending = np.arange(len(code))
+        while len(pending) > 0:
+            empty = self.key[slot.astype(np.int64)] == 0
+            empty_slot, first = np.unique(slot[empty], return_index=True)
+            winner = np.flatnonzero(empty)[first]
+            self.key[empty_slot.astype(np.int64)] = code[pending[winner]]
+            self.count[empty_slot.astype(np.int64)] = count[pending[winner]]
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[winner] = True
+            # a code that lost its empty slot probes the same slot again, it is taken now
+            move = ~placed & ~empty
+            slot = np.where(move, (slot + np.uint64(1)) & mask, slot)[~placed]
+            pending = pending[~placed]
+        self.size += len(code)
+
+    def resize(self, capacity):
+        occupied = self.key != 0
+        code = self.key[occupied]
+        count = self.count[occupied]
+        capacity = 1 << (capacity - 1).bit_length()
+        self.key = np.zeros(capacity, dtype=np.uint64)
+        self.count = np.zeros(capacity, dtype=np.uint8)
+        self.size = 0
+        bloom = self.bloom
+        # the bloom filter already holds every code
+        self.bloom = None
+        self.insert(code, count)
+        self.bloom = bloom
+
+    def hash(self, code):
+        # fibonacci hashing, the high bits of the product pick the slot
+        shift = np.uint64(64 - (len(self.key).bit_length() - 1))
+        return (code * HASH_MULTIPLIER) >> shift
+
+    def bloom_index(self, code):
+        # bloom_hash_size bit positions of each code from two multiplicative hashes
+        bit_size = np.uint64(len(self.bloom) * 8)
+        first = code * HASH_MULTIPLIER
+        second = ((code ^ (code >> np.uint64(31))) * np.uint64(0xBF58476D1CE4E5B9)) | np.uint64(1)
+        return [((first + np.uint64(i) * second) % bit_size).astype(np.int64) for i in range(self.bloom_hash_size)]
+
+    def bloom_add(self, code):
+        for index in self.bloom_index(code):
+            np.bitwise_or.at(self.bloom, index >> 3, (1 << (index & 7)).astype(np.uint8))
+
+    def bloom_contains(self, code):
+        result = np.ones(len(code), dtype=bool)
+        for index in self.bloom_index(code):
+            result &= (self.bloom[index >> 3] >> (index & 7).astype(np.uint8)) & 1 == 1
+        return result
+
+    def get_code_count(self, code):
+        # occurrence count of each code, capped at 2
+        result = np.zeros(len(code), dtype=np.uint8)
+        slot = self.find(code)
+        result[slot >= 0] = self.count[slot[slot >= 0]]
+        return result
+
+    def get_count(self, organisation_id):
+        code = self.encode([organisation_id])
+        if code[0] == 0:
+            return self.fallback_dict.get(organisation_id, 0)
+        return int(self.get_code_count(code)[0])
+
+    def get_entries(self):
+        # (codes, counts, fallback_dict) of the table, a compact form to merge it into another table
+        occupied = self.key != 0
+        return self.key[occupied], self.count[occupied], self.fallback_dict
+
+    def merge_entries(self, code, count, fallback_dict):
+        # add the counts of another table, as returned by its get_entries
+        self.add_code(np.repeat(code, count))
+        for organisation_id, organisation_count in fallback_dict.items():
+            self.fallback_dict[organisation_id] = min(self.fallback_dict.get(organisation_id, 0) + organisation_count,
+                                                      2)
+
+    def get_duplicate_size(self):
+        return int(np.count_nonzero(self.count > 1)) + sum(1 for x in self.fallback_dict.values() if x > 1)
+
+    def get_duplicate_set(self):
+        # every id counted more than once
+        duplicate_set = {self.decode(x) for x in self.key[(self.key != 0) & (self.count > 1)].tolist()}
+        duplicate_set.update(x for x, count in self.fallback_dict.items() if count > 1)
+        return duplicate_set
@@ -0,0 +1,123 @@
+import sys
+
+
+class OrganisationRecord:
+    # fixed attribute slots instead of a per instance __dict__
+    __slots__ = ('organisation_id', 'name', 'website', 'country', 'founded', 'category', 'number_of_employees',
+                 'median_salary', 'profits_in_2020_million', 'profits_in_2021_million')
+
+    # csv column -> attribute, so a record can be read like a row dictionary
+    COLUMN_DICT = {
+        'organisation id': 'organisation_id',
+        'name': 'name',
+        'website': 'website',
+        'country': 'country',
+        'founded': 'founded',
+        'category': 'category',
+        'number of employees': 'number_of_employees',
+        'median salary': 'median_salary',
+        'profits in 2020(million)': 'profits_in_2020_million',
+        'profits in 2021(million)': 'profits_in_2021_million'
+    }
+
+    def __init__(self, organisation_id, name, website, country, founded, category, number_of_employees, median_salary,
+                 profits_in_2020_million, profits_in_2021_million):
+        self.organisation_id = organisation_id
+        self.name = name
+        self.website = website
+        # country and category repeat across many records, one shared string each
+        self.country = sys.intern(country)
+        self.founded = founded
+        self.category = sys.intern(category)
+        # numeric fields are typed once
+        self.number_of_employees = int(number_of_employees)
+        self.median_salary = float(median_salary)
+        self.profits_in_2020_million = float(profits_in_2020_million)
+        self.profits_in_2021_million = float(profits_in_2021_million)
+
+    @classmethod
+    def from_row(cls, row, name='', website='', founded=''):
+        # row is a RowValidator.validate tuple (organisation id, country, category, number of employees,
+        # median salary, profits in 2020(million), profits in 2021(million)), already typed
+        (organisation_id, country, category, number_of_employees, median_salary, profits_in_2020_million,
+         profits_in_2021_million) = row
+        # founded is not validated, it is only typed when it is a plain year
+        return cls(organisation_id, name, website, country, int(founded) if founded.isdecimal() else founded,
+                   category, number_of_employees, median_salary, profits_in_2020_million, profits_in_2021_million)
+
+    def __getitem__(self, column):
+        if column not in self.COLUMN_DICT:
+            raise KeyError(column)
+        return getattr(self, self.COLUMN_DICT[column])
+
+    def __eq__(self, other):
+        if not isinstance(other, OrganisationRecord):
+            return NotImplemented
+        return self.get_field_list() == other.get_field_list()
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join([repr(x) for x in self.get_field_list()]))
+
+    def get_field_list(self):
+        # values in csv column order
+        return [getattr(self, x) for x in self.__slots__]
+
+    def get_organisation_id(self):
+        return self.organisation_id
+
+    def set_organisation_id(self, organisation_id):
+        self.organisation_id = organisation_id
+
+    def get_name(self):
+        return self.name
+
+    def set_name(self, name):
+        self.name = name
+
+    def get_website(self):
+        return self.website
+
+    def set_website(self, website):
+        self.website = website
+
+    def get_country(self):
+        return self.country
+
+    def set_country(self, country):
+        self.country = sys.intern(country)
+
+    def get_founded(self):
+        return self.founded
+
+    def set_founded(self, founded):
+        self.founded = founded
+
+    def get_category(self):
+        return self.category
+
+    def set_category(self, category):
+        self.category = sys.intern(category)
+
+    def get_number_of_employees(self):
+        return self.number_of_employees
+
+    def set_number_of_employees(self, number_of_employees):
+        self.number_of_employees = int(number_of_employees)
+
+    def get_median_salary(self):
+        return self.median_salary
+
+    def set_median_salary(self, median_salary):
+        self.median_salary = float(median_salary)
+
+    def get_profits_in_2020_million(self):
+        return self.profits_in_2020_million
+
+    def set_profits_in_2020_million(self, profits_in_2020_million):
+        self.profits_in_2020_million = float(profits_in_2020_million)
+
+    def get_profits_in_2021_million(self):
+        return self.profits_in_2021_million
+
+    def set_profits_in_2021_million(self, profits_in_2021_million):
+        self.profits_in_2021_million = float(profits_in_2021_million)
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class OrganisationTable:
+
+    def __init__(self, organisation_id, country_code, country_names, category_code, category_names,
+                 number_of_employees, median_salary, profits_in_2020_million, profits_in_2021_million):
+        # string columns are integer coded, the names list maps a code back to its value. organisation ids may be
+        # ascii bytes when the table comes from a snapshot
+        self.organisation_id = np.asarray(organisation_id)
+        if self.organisation_id.dtype.kind not in ('U', 'S'):
+            self.organisation_id = self.organisation_id.astype(np.str_)
+        self.country_code = np.asarray(country_code, dtype=np.int32)
+        self.country_names = list(country_names)
+        self.category_code = np.asarray(category_code, dtype=np.int32)
+        self.category_names = list(category_names)
+        # numeric columns are typed once when the table is built
+        self.number_of_employees = np.asarray(number_of_employees, dtype=np.int64)
+        self.median_salary = np.asarray(median_salary, dtype=np.float64)
+        self.profits_in_2020_million = np.asarray(profits_in_2020_million, dtype=np.float64)
+        self.profits_in_2021_million = np.asarray(profits_in_2021_million, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.organisation_id)
+
+    def get_organisation_id(self):
+        return self.organisation_id
+
+    def get_country_code(self):
+        return self.country_code
+
+    def get_country_names(self):
+        return self.country_names
+
+    def get_category_code(self):
+        return self.category_code
+
+    def get_category_names(self):
+        return self.category_names
+
+    def get_number_of_employees(self):
+        return self.number_of_employees
+
+    def get_median_salary(self):
+        return self.median_salary
+
+    def get_profits_in_2020_million(self):
+        return self.profits_in_2020_million
+
+    def get_profits_in_2021_million(self):
+        return self.profits_in_2021_million
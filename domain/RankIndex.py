@@ -0,0 +1,111 @@
+from bisect import bisect_left, insort
+
+
+class RankIndex:
+
+    def __init__(self, load=1000):
+        # organisations ordered by number of employees desc, profit percent change desc, then insertion order.
+        # items are (-number of employees, -profit percent change, sequence, organisation id) kept in sorted
+        # buckets of about load items, so insert, remove and rank only touch one bucket.
+        self.load = load
+        self.bucket_list = []
+        self.max_list = []
+        self.item_dict = {}
+        self.sequence = 0
+        # Fenwick tree over the bucket sizes for the rank prefix sums, rebuilt when buckets split or vanish
+        self.tree = None
+
+    def __len__(self):
+        return len(self.item_dict)
+
+    def __contains__(self, organisation_id):
+        return organisation_id in self.item_dict
+
+    def __iter__(self):
+        # (organisation id, number of employees, profit percent change) in rank order
+        for bucket in self.bucket_list:
+            for item in bucket:
+                yield item[3], -item[0], -item[1]
+
+    def insert(self, organisation_id, number_of_employees, profit_percent_change):
+        if organisation_id in self.item_dict:
+            self.remove(organisation_id)
+        self.sequence += 1
+        item = (-number_of_employees, -profit_percent_change, self.sequence, organisation_id)
+        self.item_dict[organisation_id] = item
+        if len(self.bucket_list) == 0:
+            self.bucket_list.append([item])
+            self.max_list.append(item)
+            self.tree = None
+            return
+        i = min(bisect_left(self.max_list, item), len(self.bucket_list) - 1)
+        bucket = self.bucket_list[i]
+        insort(bucket, item)
+        self.max_list[i] = bucket[-1]
+        if len(bucket) > 2 * self.load:
+            # split the bucket in half
+            self.bucket_list[i:i + 1] = [bucket[:self.load], bucket[self.load:]]
+            self.max_list[i:i + 1] = [bucket[self.load - 1], bucket[-1]]
+            self.tree = None
+        else:
+            self.tree_add(i, 1)
+
+    def remove(self, organisation_id):
+        item = self.item_dict.pop(organisation_id, None)
+        if item is None:
+            return
+        i = bisect_left(self.max_list, item)
+        bucket = self.bucket_list[i]
+        del bucket[bisect_left(bucket, item)]
+        if len(bucket) == 0:
+            del self.bucket_list[i]
+            del self.max_list[i]
+            self.tree = None
+        else:
+            self.max_list[i] = bucket[-1]
+            self.tree_add(i, -1)
+
+    def rank(self, organisation_id):
+        # rank starts from 1, None when the organisation is not in the index
+        item = self.item_dict.get(organisation_id)
+        if item is None:
+            return None
+        i = bisect_left(self.max_list, item)
+        return self.tree_prefix(i) + bisect_left(self.bucket_list[i], item) + 1
+
+    def top(self, k):
+        # the first k (organisation id, number of employees, profit percent change) in rank order
+        top_list = []
+        for bucket in self.bucket_list:
+            for item in bucket:
+                if len(top_list) >= k:
+                    return top_list
+                top_list.append((item[3], -item[0], -item[1]))
+        return top_list
+
+    def tree_build(self):
+        self.tree = [0] * (len(self.bucket_list) + 1)
+        for i in range(len(self.bucket_list)):
+            j = i + 1
+            self.tree[j] += len(self.bucket_list[i])
+            parent = j + (j & -j)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[j]
+
+    def tree_add(self, i, value):
+        if self.tree is None:
+            return
+        j = i + 1
+        while j < len(self.tree):
+            self.tree[j] += value
+            j += j & -j
+
+    def tree_prefix(self, i):
+        # number of items in the first i buckets
+        if self.tree is None:
+            self.tree_build()
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+
+# columns of a recorded row, the key columns in the order the tokenizers yield them
+ROW_COLUMN_LIST = ['organisation id', 'country', 'category', 'number of employees', 'median salary',
+                   'profits in 2020(million)', 'profits in 2021(million)']
+
+
+class RejectionReport:
+
+    def __init__(self, sample_size=20, spill_file=None, spill_buffer_size=10000):
+        # rejection count by (reason, column)
+        self.count_dict = {}
+        # bounded sample of offending rows, rows are kept raw and only formatted on demand
+        self.sample_size = sample_size
+        self.sample_list = []
+        # optional jsonl spill of every rejected row, written in batches
+        self.spill_file = spill_file
+        self.spill_buffer_size = spill_buffer_size
+        self.spill_buffer = []
+
+    def __call__(self, column, row):
+        # RowValidator rejection sink
+        self.reject('invalid', column, row)
+
+    def reject(self, reason, column, row):
+        row = self.record_row(row)
+        key = (reason, column)
+        self.count_dict[key] = self.count_dict.get(key, 0) + 1
+        if len(self.sample_list) < self.sample_size:
+            self.sample_list.append((reason, column, row))
+        if self.spill_file is not None:
+            self.spill_buffer.append((reason, column, row))
+            if len(self.spill_buffer) >= self.spill_buffer_size:
+                self.flush()
+
+    def duplicate(self, row):
+        # valid row excluded because its organisation id appears more than once
+        self.reject('duplicate', 'organisation id', row)
+
+    @staticmethod
+    def record_row(row):
+        # every row is recorded as {column: string} of ROW_COLUMN_LIST, whatever the engine. row is the key fields in
+        # ROW_COLUMN_LIST order, a row dictionary or a record read like one. numbers that were already parsed when
+        # the row was rejected are written back with str()
+        if isinstance(row, (list, tuple)):
+            value_list = list(row[:len(ROW_COLUMN_LIST)]) + [''] * (len(ROW_COLUMN_LIST) - len(row))
+        elif isinstance(row, dict):
+            value_list = [row.get(x, '') for x in ROW_COLUMN_LIST]
+        else:
+            value_list = [row[x] for x in ROW_COLUMN_LIST]
+        return {column: value if isinstance(value, str) else str(value)
+                for column, value in zip(ROW_COLUMN_LIST, value_list)}
+
+    def merge(self, other):
+        for key, count in other.count_dict.items():
+            self.count_dict[key] = self.count_dict.get(key, 0) + count
+        self.sample_list.extend(other.sample_list[:self.sample_size - len(self.sample_list)])
+        # append the other spill file after the rows spilled so far
+        if self.spill_file is not None and other.spill_file is not None and os.path.exists(other.spill_file):
+            self.flush()
+            with open(other.spill_file, 'r') as src, open(self.spill_file, 'a') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(other.spill_file)
+
+    def flush(self):
+        if self.spill_file is None or len(self.spill_buffer) == 0:
+            return
+        with open(self.spill_file, 'a') as f:
+            f.writelines([json.dumps({'reason': x[0], 'column': x[1], 'row': x[2]}) + "\n" for x in self.spill_buffer])
+        self.spill_buffer = []
+
+    def get_total(self):
+        return sum(self.count_dict.values())
+
+    def get_count(self, reason=None, column=None):
+        return sum(count for (x_reason, x_column), count in self.count_dict.items()
+                   if (reason is None or x_reason == reason) and (column is None or x_column == column))
+
+    def get_sample_list(self):
+        return self.sample_list
+
+    def summary(self):
+        reason_dict = {}
+        column_dict = {}
+        for (reason, column), count in self.count_dict.items():
+            reason_dict[reason] = reason_dict.get(reason, 0) + count
+            column_dict[column] = column_dict.get(column, 0) + count
+        return {
+            'total': self.get_total(),
+            'reason': reason_dict,
+            'column': column_dict,
+            'sample': [{'reason': x[0], 'column': x[1], 'row': x[2]} for x in self.sample_list]
+        }
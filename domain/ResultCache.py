@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+import zlib
+
+
+class ResultCache:
+
+    def __init__(self, cache_dir, max_size=256 * 1024 * 1024, sample_size=64 * 1024, sample_count=16):
+        # entries are zlib compressed pickles, the least recently used ones are evicted above max_size bytes. every
+        # hit reads, decompresses and unpickles its entry, so a caller changing its result does not change the
+        # cached one. unpickling is most of the cost, an in memory copy of the pickle would save little. a hit on
+        # the result of a 500k row file takes some 0.4 s, it grows with the number of organisations
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # the content hash reads sample_count blocks of sample_size bytes spread over the file
+        self.sample_size = sample_size
+        self.sample_count = sample_count
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def file_identity(self, csvfile):
+        # (device, inode, size, mtime, ctime, sampled content hash) of the file, None when it can not be read. any
+        # write or utime call sets the ctime, so an edit that restores the size and the mtime still changes the
+        # identity without reading the whole file. the sampled hash also catches a clock set back between writes
+        try:
+            with open(csvfile, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                content_hash = hashlib.blake2b(digest_size=16)
+                if stat.st_size <= self.sample_size * self.sample_count:
+                    content_hash.update(f.read())
+                else:
+                    step = (stat.st_size - self.sample_size) // (self.sample_count - 1)
+                    for i in range(self.sample_count):
+                        f.seek(i * step)
+                        content_hash.update(f.read(self.sample_size))
+                return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns,
+                        content_hash.hexdigest())
+        except IOError:
+            return None
+
+    def entry_file(self, csvfile, variant):
+        # one entry per file path and result variant, a changed file replaces its entry
+        key = "{}\0{}".format(os.path.abspath(csvfile), variant)
+        return os.path.join(self.cache_dir, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ".cache")
+
+    def get(self, csvfile, variant, identity):
+        entry_file = self.entry_file(csvfile, variant)
+        if identity is None:
+            return None
+        if not os.path.exists(entry_file):
+            return None
+        try:
+            with open(entry_file, 'rb') as f:
+                entry_identity, result_data = pickle.loads(zlib.decompress(f.read()))
+            if entry_identity != identity:
+                # the file changed since the entry was written
+                self.remove(entry_file)
+                return None
+            result = pickle.loads(result_data)
+        except (IOError, zlib.error, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            self.remove(entry_file)
+            return None
+        # the modification time of an entry is its last use
+        os.utime(entry_file)
+        return result
+
+    def put(self, csvfile, variant, identity, result):
+        if identity is None:
+            return
+        entry_file = self.entry_file(csvfile, variant)
+        # the result is pickled on its own, its identity is checked before it is unpickled
+        result_data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_file = "{}.{}.tmp".format(entry_file, os.getpid())
+        with open(temp_file, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps((identity, result_data), protocol=pickle.HIGHEST_PROTOCOL), 1))
+        os.replace(temp_file, entry_file)
+        self.evict()
+
+    def evict(self):
+        entry_list = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".cache"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entry_list.append((stat.st_mtime_ns, stat.st_size, name))
+        total_size = sum(x[1] for x in entry_list)
+        # least recently used first
+        for mtime, size, name in sorted(entry_list):
+            if total_size <= self.max_size:
+                break
+            self.remove(os.path.join(self.cache_dir, name))
+            total_size -= size
+
+    def remove(self, entry_file):
+        try:
+            os.remove(entry_file)
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".cache"):
+                self.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,97 @@
+import re
+from operator import itemgetter
+
+# float() syntax: digits with optional underscores, decimal point, exponent, inf and nan. float() strips the
+# whitespace \s matches except the ascii separators \x1c to \x1f
+FLOAT_PATTERN = re.compile(r'[^\S\x1c-\x1f]*[+-]?(?:(?:(?:\d(?:_?\d)*)?\.\d(?:_?\d)*|\d(?:_?\d)*\.?)'
+                           r'(?:e[+-]?\d(?:_?\d)*)?|inf|infinity|nan)[^\S\x1c-\x1f]*', re.IGNORECASE)
+
+
+class RowValidator:
+
+    def __init__(self, header, rejection_sink=None):
+        # resolve the column indices once per file, None when the header does not have the column
+        self.header = header
+        self.country_index = self.column_index('country')
+        self.category_index = self.column_index('category')
+        self.organisation_id_index = self.column_index('organisation id')
+        self.number_of_employees_index = self.column_index('number of employees')
+        self.median_salary_index = self.column_index('median salary')
+        self.profits_in_2020_million_index = self.column_index('profits in 2020(million)')
+        self.profits_in_2021_million_index = self.column_index('profits in 2021(million)')
+        index_list = [self.country_index, self.category_index, self.organisation_id_index,
+                      self.number_of_employees_index, self.median_salary_index, self.profits_in_2020_million_index,
+                      self.profits_in_2021_million_index]
+        # key columns in the order check returns them, a rejected row is handed over in this order
+        self.key_index_list = [self.organisation_id_index, self.country_index, self.category_index,
+                               self.number_of_employees_index, self.median_salary_index,
+                               self.profits_in_2020_million_index, self.profits_in_2021_million_index]
+        # fast path picks every field in one call when the row is long enough
+        self.row_getter = itemgetter(*index_list) if None not in index_list else None
+        self.row_length = max(index_list) + 1 if None not in index_list else 0
+        # rejection_sink(column, fields) receives the key fields of every malformed row, in the order check returns
+        # them
+        self.rejection_sink = rejection_sink
+
+    def column_index(self, column):
+        # same as dict(zip(header, data)), the last duplicated header column wins
+        index = None
+        for i in range(len(self.header)):
+            if self.header[i] == column:
+                index = i
+        return index
+
+    def get_field(self, fields, index):
+        if index is None or index >= len(fields):
+            return ''
+        return fields[index]
+
+    def get_organisation_id(self, fields):
+        return self.get_field(fields, self.organisation_id_index)
+
+    def check(self, fields):
+        # return the picked string fields (organisation id, country, category, number of employees, median salary,
+        # profits in 2020(million), profits in 2021(million)) or None when the row is rejected. nothing is converted
+        if self.row_getter is not None and len(fields) >= self.row_length:
+            (country, category, organisation_id, number_of_employees, median_salary, profits_in_2020_million,
+             profits_in_2021_million) = self.row_getter(fields)
+        else:
+            country = self.get_field(fields, self.country_index)
+            category = self.get_field(fields, self.category_index)
+            organisation_id = self.get_field(fields, self.organisation_id_index)
+            number_of_employees = self.get_field(fields, self.number_of_employees_index)
+            median_salary = self.get_field(fields, self.median_salary_index)
+            profits_in_2020_million = self.get_field(fields, self.profits_in_2020_million_index)
+            profits_in_2021_million = self.get_field(fields, self.profits_in_2021_million_index)
+        if len(country) == 0:
+            return self.reject('country', fields)
+        if len(category) == 0:
+            return self.reject('category', fields)
+        if not organisation_id.isalnum():
+            return self.reject('organisation id', fields)
+        if not number_of_employees.isdecimal():
+            return self.reject('number of employees', fields)
+        # plain digits are the common case, the full float syntax is only matched otherwise
+        if not median_salary.isdecimal() and FLOAT_PATTERN.fullmatch(median_salary) is None:
+            return self.reject('median salary', fields)
+        if not profits_in_2020_million.isdecimal() and FLOAT_PATTERN.fullmatch(profits_in_2020_million) is None:
+            return self.reject('profits in 2020(million)', fields)
+        if not profits_in_2021_million.isdecimal() and FLOAT_PATTERN.fullmatch(profits_in_2021_million) is None:
+            return self.reject('profits in 2021(million)', fields)
+        return (organisation_id, country, category, number_of_employees, median_salary, profits_in_2020_million,
+                profits_in_2021_million)
+
+    def validate(self, fields):
+        # same as check, with the numbers converted. every field has been checked, the conversions can not fail
+        row = self.check(fields)
+        if row is None:
+            return None
+        (organisation_id, country, category, number_of_employees, median_salary, profits_in_2020_million,
+         profits_in_2021_million) = row
+        return (organisation_id, country, category, int(number_of_employees), float(median_salary),
+                float(profits_in_2020_million), float(profits_in_2021_million))
+
+    def reject(self, column, fields):
+        if self.rejection_sink is not None:
+            self.rejection_sink(column, [self.get_field(fields, x) for x in self.key_index_list])
+        return None
@@ -0,0 +1,64 @@
+import sys
+import time
+import tracemalloc
+
+
+class StageMetrics:
+
+    def __init__(self, callback=None, trace_memory=False):
+        # one dictionary per stage in run order, callback(stage_dict) is called as each stage finishes
+        self.stage_list = []
+        self.callback = callback
+        # tracemalloc slows every allocation down, the traced memory of each stage is only measured on request
+        self.trace_memory = trace_memory
+
+    def run(self, stage, rows_in, function, *args):
+        # run function(*args) as one stage and return its result. rows_in is None when the stage produces its rows
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        block_start = sys.getallocatedblocks()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = function(*args)
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.process_time() - cpu_start
+        rows_out = len(result) if result is not None else 0
+        stage_dict = {
+            'stage': stage,
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'rows_in': rows_out if rows_in is None else rows_in,
+            'rows_out': rows_out,
+            # memory blocks still allocated by the stage, freed ones are not counted
+            'allocated_blocks': sys.getallocatedblocks() - block_start
+        }
+        if self.trace_memory:
+            memory_current, memory_peak = tracemalloc.get_traced_memory()
+            stage_dict['memory_delta'] = memory_current - memory_start
+            stage_dict['memory_peak'] = memory_peak - memory_start
+        if start_tracing:
+            tracemalloc.stop()
+        self.stage_list.append(stage_dict)
+        if self.callback is not None:
+            self.callback(stage_dict)
+        return result
+
+    def get_stage_list(self):
+        return self.stage_list
+
+    def get_stage(self, stage):
+        # the last run of the stage, None when it has not run
+        for stage_dict in reversed(self.stage_list):
+            if stage_dict['stage'] == stage:
+                return stage_dict
+        return None
+
+    def get_wall_time(self):
+        return sum(x['wall_time'] for x in self.stage_list)
+
+    def get_cpu_time(self):
+        return sum(x['cpu_time'] for x in self.stage_list)
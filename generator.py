@@ -0,0 +1,227 @@
+import argparse
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import solution
+
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+NAME_WORD_LIST = ['acme', 'apex', 'blue', 'bright', 'cedar', 'delta', 'eagle', 'echo', 'global', 'green', 'harbor',
+                  'iron', 'lake', 'maple', 'north', 'nova', 'oak', 'pioneer', 'prime', 'river', 'silver', 'summit',
+                  'union', 'vertex', 'west']
+NAME_SUFFIX_LIST = ['group', 'holdings', 'inc', 'labs', 'ltd', 'partners', 'systems', 'solutions', 'works']
+# rejected value of each key column, in solution.KEY_COLUMN_LIST order
+INVALID_VALUE_LIST = ['bad-id', '', '', 'n/a', 'abc', '', 'unknown']
+# dtype of each snapshot column written by generate_snapshot
+SNAPSHOT_DTYPE_DICT = {'organisation_id': 'S15', 'country_code': np.int32, 'category_code': np.int32,
+                       'number_of_employees': np.int64, 'median_salary': np.float64,
+                       'profits_in_2020_million': np.float64, 'profits_in_2021_million': np.float64}
+
+
+def generate_block(size: int, seed, country_size: int = 200, category_size: int = 50, duplicate_rate: float = 0.0,
+                   invalid_rate: float = 0.0, skew: float = 1.0) -> dict:
+    # generate the columns of size organisations. country and category codes follow a zipf like distribution,
+    # duplicate_rate of the rows reuse the organisation id of an earlier row and invalid_rate of the rows get one
+    # rejected key column, given by invalid_column (-1 for a valid row)
+    rng = np.random.default_rng(seed)
+    column_dict = {'organisation_id': rng.integers(0, 2 ** 60, size, dtype=np.uint64)}
+    duplicate_index = np.flatnonzero(rng.random(size) < duplicate_rate)
+    duplicate_index = duplicate_index[duplicate_index > 0]
+    source_index = (rng.random(len(duplicate_index)) * duplicate_index).astype(np.int64)
+    column_dict['organisation_id'][duplicate_index] = column_dict['organisation_id'][source_index]
+    column_dict['country_code'] = rng.choice(country_size, size, p=zipf_weights(country_size, skew)).astype(np.int32)
+    column_dict['category_code'] = rng.choice(category_size, size,
+                                              p=zipf_weights(category_size, skew)).astype(np.int32)
+    column_dict['number_of_employees'] = rng.integers(1, 10000, size, dtype=np.int64)
+    column_dict['median_salary'] = rng.integers(20000, 200000, size).astype(np.float64)
+    column_dict['profits_in_2020_million'] = rng.integers(1, 1000000, size).astype(np.float64)
+    column_dict['profits_in_2021_million'] = rng.integers(1, 1000000, size).astype(np.float64)
+    column_dict['name_word'] = rng.integers(0, len(NAME_WORD_LIST), size)
+    column_dict['name_suffix'] = rng.integers(0, len(NAME_SUFFIX_LIST), size)
+    column_dict['founded'] = rng.integers(1900, 2022, size)
+    column_dict['invalid_column'] = np.where(rng.random(size) < invalid_rate,
+                                             rng.integers(0, len(INVALID_VALUE_LIST), size), -1)
+    return column_dict
+
+
+def zipf_weights(size: int, skew: float) -> np.ndarray:
+    weights = 1 / np.arange(1, size + 1) ** skew
+    return weights / weights.sum()
+
+
+def hex_organisation_id(organisation_id: np.ndarray) -> np.ndarray:
+    # 15 lowercase hex digits per id as ascii bytes, converted for the whole column at once
+    shift = np.arange(56, -1, -4, dtype=np.uint64)
+    digits = HEX_DIGITS[((organisation_id[:, None] >> shift) & np.uint64(0xf)).astype(np.intp)]
+    return np.ascontiguousarray(digits).view('S15').ravel()
+
+
+def format_block(column_dict: dict) -> str:
+    # csv text of a generated block, the columns are converted to text one at a time
+    country_names = np.array(country_name_list(range(column_dict['country_code'].max(initial=0) + 1)), dtype=object)
+    category_names = np.array(category_name_list(range(column_dict['category_code'].max(initial=0) + 1)),
+                              dtype=object)
+    name_words = np.array(NAME_WORD_LIST, dtype=object)[column_dict['name_word']]
+    name_suffixes = np.array(NAME_SUFFIX_LIST, dtype=object)[column_dict['name_suffix']]
+    key_column_list = [hex_organisation_id(column_dict['organisation_id']).astype(np.str_).tolist(),
+                       country_names[column_dict['country_code']].tolist(),
+                       category_names[column_dict['category_code']].tolist(),
+                       solution.number_text(column_dict['number_of_employees']),
+                       solution.number_text(column_dict['median_salary']),
+                       solution.number_text(column_dict['profits_in_2020_million']),
+                       solution.number_text(column_dict['profits_in_2021_million'])]
+    # one rejected key column per invalid row, only those rows are touched
+    for i in np.flatnonzero(column_dict['invalid_column'] >= 0).tolist():
+        column = column_dict['invalid_column'][i]
+        key_column_list[column][i] = INVALID_VALUE_LIST[column]
+    column_list = [key_column_list[0], (name_words + ' ' + name_suffixes).tolist(),
+                   ('https://www.' + name_words + name_suffixes + '.com').tolist(), key_column_list[1],
+                   solution.number_text(column_dict['founded']), key_column_list[2]] + key_column_list[3:]
+    return solution.format_csv_rows(list(zip(*column_list)), len(solution.ORGANISATION_COLUMN_LIST), True)
+
+
+def country_name_list(code_list) -> list:
+    return ['country_{:03d}'.format(x) for x in code_list]
+
+
+def category_name_list(code_list) -> list:
+    return ['category_{:03d}'.format(x) for x in code_list]
+
+
+def block_seed_list(size: int, block_size: int, seed: int) -> list:
+    # (block size, block seed), the output only depends on seed and block_size, not on the number of workers
+    block_count = -(-size // block_size)
+    seed_list = np.random.SeedSequence(seed).spawn(block_count)
+    return [(min(block_size, size - i * block_size), seed_list[i]) for i in range(block_count)]
+
+
+def generate_csv_block(block_args: tuple) -> str:
+    block_size, seed, option_dict = block_args
+    return format_block(generate_block(block_size, seed, **option_dict))
+
+
+def generate_snapshot_block(block_args: tuple) -> dict:
+    # the snapshot columns of a block without invalid rows and without any row of a duplicated organisation id.
+    # duplicates are only generated within a block, so every block is filtered on its own
+    block_size, seed, option_dict = block_args
+    column_dict = generate_block(block_size, seed, **option_dict)
+    # a row with a rejected organisation id does not count as a duplicate, every other row does
+    organisation_id = column_dict['organisation_id']
+    id_row = column_dict['invalid_column'] != 0
+    unique_id, inverse, count = np.unique(organisation_id[id_row], return_inverse=True, return_counts=True)
+    duplicate_row = np.zeros(len(organisation_id), dtype=bool)
+    duplicate_row[id_row] = count[inverse] > 1
+    keep = (column_dict['invalid_column'] < 0) & ~duplicate_row
+    snapshot_dict = {name: column_dict[name][keep] for name in solution.SNAPSHOT_COLUMN_LIST}
+    snapshot_dict['organisation_id'] = hex_organisation_id(snapshot_dict['organisation_id'])
+    return snapshot_dict
+
+
+def map_blocks(function, block_args_list: list, workers: int):
+    # blocks come back in order, in this process when there is a single worker
+    if workers is not None and workers <= 1:
+        return map(function, block_args_list)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    return executor_map(executor, function, block_args_list, 2 * (workers or os.cpu_count()))
+
+
+def executor_map(executor: ProcessPoolExecutor, function, block_args_list: list, pending_size: int):
+    # at most pending_size blocks are submitted ahead of the one being written, finished blocks do not pile up in
+    # memory when the writer falls behind
+    with executor:
+        pending = deque()
+        for block_args in block_args_list:
+            pending.append(executor.submit(function, block_args))
+            if len(pending) >= pending_size:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+def generate_csv(csvfile: str, size: int, seed: int = 0, workers: int = 1, block_size: int = 100000,
+                 buffer_size: int = 4 * 1024 * 1024, **option_dict) -> int:
+    # write size generated organisations to csvfile, option_dict is passed to generate_block
+    block_args_list = [(x[0], x[1], option_dict) for x in block_seed_list(size, block_size, seed)]
+    with open(csvfile, 'w', newline='', buffering=buffer_size) as f:
+        f.write(",".join(solution.ORGANISATION_COLUMN_LIST) + "\n")
+        for text in map_blocks(generate_csv_block, block_args_list, workers):
+            f.write(text)
+    return size
+
+
+def generate_snapshot(snapshot_file: str, size: int, seed: int = 0, workers: int = 1, block_size: int = 100000,
+                      **option_dict) -> int:
+    # write the table solution.load_file_table would build from generate_csv with the same arguments, that is
+    # without invalid rows and without any row of a duplicated organisation id. returns the number of organisations.
+    # every column is appended to its own temporary file block by block, the snapshot is assembled from them
+    block_args_list = [(x[0], x[1], option_dict) for x in block_seed_list(size, block_size, seed)]
+    temp_dir = tempfile.mkdtemp(prefix="snapshot_", dir=os.path.dirname(os.path.abspath(snapshot_file)))
+    try:
+        column_file_dict = {name: os.path.join(temp_dir, name) for name in solution.SNAPSHOT_COLUMN_LIST}
+        country_code_set = set()
+        category_code_set = set()
+        length = 0
+        file_dict = {name: open(column_file, 'wb') for name, column_file in column_file_dict.items()}
+        try:
+            for snapshot_dict in map_blocks(generate_snapshot_block, block_args_list, workers):
+                for name, f in file_dict.items():
+                    f.write(snapshot_dict[name].astype(SNAPSHOT_DTYPE_DICT[name]).tobytes())
+                country_code_set.update(np.unique(snapshot_dict['country_code']).tolist())
+                category_code_set.update(np.unique(snapshot_dict['category_code']).tolist())
+                length += len(snapshot_dict['organisation_id'])
+        finally:
+            for f in file_dict.values():
+                f.close()
+        # codes of the countries and categories left after filtering, in name order
+        country_codes = sorted(country_code_set)
+        category_codes = sorted(category_code_set)
+        code_map_dict = {'country_code': code_map(country_codes), 'category_code': code_map(category_codes)}
+        solution.write_snapshot_columns(snapshot_file, country_name_list(country_codes),
+                                        category_name_list(category_codes),
+                                        [(name, SNAPSHOT_DTYPE_DICT[name], length,
+                                          iter_column_file(column_file_dict[name], SNAPSHOT_DTYPE_DICT[name],
+                                                           block_size, code_map_dict.get(name)))
+                                         for name in solution.SNAPSHOT_COLUMN_LIST])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return length
+
+
+def code_map(code_list: list) -> np.ndarray:
+    # generated code -> position in code_list
+    result = np.zeros(max(code_list, default=-1) + 1, dtype=np.int32)
+    result[code_list] = np.arange(len(code_list), dtype=np.int32)
+    return result
+
+
+def iter_column_file(column_file: str, dtype, block_size: int, code_map_array: np.ndarray = None):
+    # the values of a temporary column file, block_size at a time, mapped through code_map_array when given
+    with open(column_file, 'rb') as f:
+        while True:
+            values = np.fromfile(f, dtype=dtype, count=block_size)
+            if len(values) == 0:
+                return
+            yield values if code_map_array is None else code_map_array[values]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="generate synthetic organisations data")
+    parser.add_argument('output_file')
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--block-size', type=int, default=100000)
+    parser.add_argument('--country-size', type=int, default=200)
+    parser.add_argument('--category-size', type=int, default=50)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0)
+    parser.add_argument('--invalid-rate', type=float, default=0.0)
+    parser.add_argument('--snapshot', action='store_true', help="write a binary snapshot instead of csv")
+    args = parser.parse_args()
+    generate = generate_snapshot if args.snapshot else generate_csv
+    generate(args.output_file, args.size, seed=args.seed, workers=args.workers, block_size=args.block_size,
+             country_size=args.country_size, category_size=args.category_size,
+             duplicate_rate=args.duplicate_rate, invalid_rate=args.invalid_rate)
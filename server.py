@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import solution
+
+REASON_DICT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               503: 'Service Unavailable'}
+
+
+class QueryServer:
+
+    def __init__(self, csvfile, host='127.0.0.1', port=8080, poll_interval=1.0, compute=solution.main,
+                 executor=None):
+        # serves country/<name> and category/<name>?top=k from the result of compute(csvfile), recomputed in the
+        # executor when the file changes. only local connections by default
+        self.csvfile = csvfile
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+        self.compute = compute
+        self.executor = executor
+        self.own_executor = executor is None
+        # (file identity, country_dict, category_dict), replaced as a whole so a reader never sees half an update
+        self.state = None
+        self.refresh_lock = None
+        self.server = None
+        self.watch_task = None
+
+    async def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1)
+        self.refresh_lock = asyncio.Lock()
+        await self.refresh()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.watch_task = asyncio.create_task(self.watch())
+
+    async def close(self):
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.own_executor and self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def file_identity(self):
+        try:
+            stat = os.stat(self.csvfile)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    async def refresh(self, force=False):
+        # recompute when the file changed since the current state, returns whether the state was replaced
+        async with self.refresh_lock:
+            identity = self.file_identity()
+            if identity is None or (not force and self.state is not None and self.state[0] == identity):
+                return False
+            country_dict, category_dict = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.compute, self.csvfile)
+            self.state = (identity, country_dict, category_dict)
+            return True
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # keep serving the last good state
+                print("Refresh file:[{}] error:{}".format(self.csvfile, e))
+
+    def query(self, target):
+        # (status, payload) of a country/<name> or category/<name>?top=k target
+        state = self.state
+        if state is None:
+            return 503, {'error': "data is not loaded"}
+        try:
+            url = urlsplit(target)
+        except ValueError:
+            # a malformed target, such as an unclosed ipv6 host in //[::1
+            return 400, {'error': "bad request target"}
+        path = url.path.strip('/').split('/')
+        if len(path) != 2 or path[0] not in ('country', 'category'):
+            return 404, {'error': "unknown path"}
+        name = unquote(path[1]).lower()
+        if path[0] == 'country':
+            if name not in state[1]:
+                return 404, {'error': "unknown country"}
+            t_test_score, minkowski_distance = state[1][name]
+            return 200, {'country': name, 't_test_score': t_test_score, 'minkowski_distance': minkowski_distance}
+        if name not in state[2]:
+            return 404, {'error': "unknown category"}
+        top_list = parse_qs(url.query).get('top')
+        if top_list is not None and (not top_list[0].isdecimal() or int(top_list[0]) == 0):
+            return 400, {'error': "top should be a positive integer"}
+        # organisations of a category are kept in rank order
+        organisation_iter = state[2][name].items()
+        if top_list is not None:
+            organisation_iter = islice(organisation_iter, int(top_list[0]))
+        return 200, {'category': name, 'organisation_list': [
+            {'organisation id': organisation_id, 'number of employees': data[0], 'profit percent change': data[1],
+             'rank': data[2]} for organisation_id, data in organisation_iter]}
+
+    async def handle(self, reader, writer):
+        # one http request per connection
+        try:
+            try:
+                request_line = (await reader.readline()).decode('latin-1').split()
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+            except (ValueError, asyncio.LimitOverrunError):
+                # a request or header line longer than the stream limit
+                request_line = []
+            if len(request_line) < 2:
+                status, payload = 400, {'error': "bad request"}
+            elif request_line[0] != 'GET':
+                status, payload = 405, {'error': "only GET is supported"}
+            else:
+                status, payload = self.query(request_line[1])
+            body = json.dumps(payload).encode()
+            writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                         "Connection: close\r\n\r\n".format(status, REASON_DICT[status], len(body)).encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def get_port(self):
+        return self.port
+
+
+async def serve(csvfile, host='127.0.0.1', port=8080, poll_interval=1.0):
+    server = QueryServer(csvfile, host, port, poll_interval)
+    await server.start()
+    print("Serving file:[{}] on http://{}:{}".format(csvfile, host, server.get_port()))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="serve country and category statistics of an organisations csv")
+    parser.add_argument('csvfile')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.csvfile, args.host, args.port, args.poll_interval))
+    except KeyboardInterrupt:
+        pass
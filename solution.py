@@ -3,6 +3,63 @@ CITS1401 Project 2
 Full Name: Tong LAN
 Student ID: 24056082
 """
+import cProfile
+import csv
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import heapq
+import io
+import json
+import mmap
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress, islice
+from operator import attrgetter, itemgetter
+
+import numpy as np
+
+from domain.CategoryRunSorter import CategoryRunSorter
+from domain.CountryAccumulator import CountryAccumulator
+from domain.IncrementalState import IncrementalState
+from domain.LazyResultView import LazyResultView
+from domain.OrganisationIdSorter import OrganisationIdSorter
+from domain.OrganisationIdTable import OrganisationIdTable
+from domain.OrganisationRecord import OrganisationRecord
+from domain.OrganisationTable import OrganisationTable
+from domain.RejectionReport import RejectionReport
+from domain.RowValidator import RowValidator
+from domain.StageMetrics import StageMetrics
+
+# binary snapshot of an OrganisationTable
+SNAPSHOT_MAGIC = b'ORGSNAP1'
+SNAPSHOT_ALIGNMENT = 64
+SNAPSHOT_COLUMN_LIST = ['organisation_id', 'country_code', 'category_code', 'number_of_employees', 'median_salary',
+                        'profits_in_2020_million', 'profits_in_2021_million']
+
+# columns used by the statistics, the order of the fields yielded by the tokenizers
+KEY_COLUMN_LIST = ['organisation id', 'country', 'category', 'number of employees', 'median salary',
+                   'profits in 2020(million)', 'profits in 2021(million)']
+# numeric key columns, typed by RowValidator.validate
+NUMERIC_COLUMN_LIST = KEY_COLUMN_LIST[3:]
+# key columns followed by the other Organisations table columns, in the order the bulk loader inserts them
+LOAD_COLUMN_LIST = KEY_COLUMN_LIST + ['name', 'website', 'founded']
+# every csv column, in the order Organisations writes them
+ORGANISATION_COLUMN_LIST = ['organisation id', 'name', 'website', 'country', 'founded', 'category', 'number of employees',
+                            'median salary', 'profits in 2020(million)', 'profits in 2021(million)']
+# organisation ids are counted in the id table this many rows at a time
+ID_BATCH_SIZE = 65536
+# line breaks of a file read in text mode, and the bytes the mmap tokenizer reads at a time
+LINE_BREAK_PATTERN = re.compile(rb'\r\n?|\n')
+LINE_BLOCK_SIZE = 1024 * 1024
+# bytes hashed at each end of the processed part of an incrementally read file
+FINGERPRINT_SIZE = 64 * 1024
+# duplicated organisation ids of a parallel worker process, set by init_chunk_worker
+chunk_duplicate_id_set = set()
+# columns of a streamed category ranking
+CATEGORY_COLUMN_LIST = ['category', 'organisation id', 'number of employees', 'profit percent change', 'rank']
 
 
 def read_file(csvfile: str) -> list:
@@ -15,79 +72,185 @@ def read_file(csvfile: str) -> list:
         return None
 
 
-def save_file_data(read_data: list) -> list:
-    data_list = []
-    # get csv header
-    header = read_data[0].lower().strip().split(',')
-    # save to a dictionary list
-    organisation_id_set = set()
-    organisation_duplicate_id_set = set()
-    for i in range(1, len(read_data)):
-        line = read_data[i].lower().strip()
+def iter_line_fields(line_iter, header: list, column_list: list = KEY_COLUMN_LIST):
+    # yield the column_list fields of each text line, in column_list order
+    index_list = [column_index(header, column) for column in column_list]
+    row_getter = itemgetter(*index_list) if None not in index_list else None
+    row_length = max(index_list) + 1 if None not in index_list else 0
+    for line in line_iter:
+        line = line.lower().strip()
         # empty line
         if len(line) == 0:
             continue
         data = line.split(',')
-        # save to a dictionary
-        data_dict = dict(zip(header, data))
+        if row_getter is not None and len(data) >= row_length:
+            yield list(row_getter(data))
+        else:
+            yield [data[i] if i is not None and i < len(data) else '' for i in index_list]
+
+
+def iter_mmap_fields(csvfile: str, start: int = None, end: int = None):
+    # scan the raw bytes of a memory mapped file and yield the key column fields of each row, in KEY_COLUMN_LIST
+    # order. name, website and founded are never decoded and only the key columns are lowercased.
+    try:
+        with open(csvfile, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header_end = next_line_start(mm, 0)
+                header = mm[:header_end].decode().lower().strip().split(',')
+                index_list = [column_index(header, column) for column in KEY_COLUMN_LIST]
+                # fast path picks every key column in one call when the row is long enough
+                row_getter = itemgetter(*index_list) if None not in index_list else None
+                row_length = max(index_list) + 1 if None not in index_list else 0
+                start = header_end if start is None else start
+                end = len(mm) if end is None else end
+                for line in iter_mmap_lines(mm, start, end):
+                    line = line.strip()
+                    # empty line
+                    if len(line) == 0:
+                        continue
+                    data = line.split(b',')
+                    if row_getter is not None and len(data) >= row_length:
+                        organisation_id, country, category, number_of_employees, median_salary, \
+                            profit_2020, profit_2021 = row_getter(data)
+                    else:
+                        organisation_id, country, category, number_of_employees, median_salary, \
+                            profit_2020, profit_2021 = [data[i] if i is not None and i < len(data) else b''
+                                                        for i in index_list]
+                    yield [organisation_id.decode().lower(), country.decode().lower(), category.decode().lower(),
+                           number_of_employees.decode(), median_salary.decode(), profit_2020.decode(),
+                           profit_2021.decode()]
+    except IOError:
+        print("Cannot open file:[%s]" % csvfile)
+
+
+def next_line_start(mm: mmap.mmap, position: int) -> int:
+    # position after the line break ending the line at position, the end of the file for the last line
+    line_break = LINE_BREAK_PATTERN.search(mm, position)
+    return len(mm) if line_break is None else line_break.end()
+
+
+def last_line_end(data, position: int) -> int:
+    # position after the last line break of the bytes or mmap from position on, position when there is none
+    return max(data.rfind(b'\n', position), data.rfind(b'\r', position), position - 1) + 1
+
+
+def iter_mmap_lines(mm: mmap.mmap, start: int, end: int):
+    # lines between start and end, split on \n, \r and \r\n like a file read in text mode. the bytes are read in
+    # blocks cut after a line break, a \r\n cut in two only adds an empty line
+    while start < end:
+        block = mm[start:min(start + LINE_BLOCK_SIZE, end)]
+        if start + len(block) < end:
+            cut = last_line_end(block, 0)
+            # a line longer than the block is read up to its line break
+            block = block[:cut] if cut > 0 else mm[start:min(next_line_start(mm, start), end)]
+        yield from block.splitlines()
+        start += len(block)
+
+
+def column_index(header: list, column: str):
+    # same as dict(zip(header, data)), the last duplicated header column wins
+    index = None
+    for i in range(len(header)):
+        if header[i] == column:
+            index = i
+    return index
+
+
+def save_file_data(read_data: list, rejections: RejectionReport = None) -> list:
+    # get csv header
+    header = read_data[0].lower().strip().split(',')
+    # every row is checked by the compiled validator, invalid rows go to the rejection report
+    validator = RowValidator(header, rejections)
+    # skip empty lines
+    line_iter = (x.lower().strip() for x in islice(read_data, 1, None))
+    data_iter = (line.split(',') for line in line_iter if len(line) > 0)
+    # save to a dictionary, each number is parsed once by the validator and kept typed in the row
+    return collect_valid_rows(data_iter, validator, lambda row, data: typed_data_dict(header, row, data),
+                              itemgetter('organisation id'), rejections)
+
+
+def typed_data_dict(header: list, row: tuple, data: list) -> dict:
+    data_dict = dict(zip(header, data))
+    data_dict.update(zip(NUMERIC_COLUMN_LIST, row[3:]))
+    return data_dict
+
+
+def save_file_records(read_data: list, rejections: RejectionReport = None) -> list:
+    # same rows as save_file_data, as compact OrganisationRecord objects instead of dictionaries
+    # get csv header
+    header = read_data[0].lower().strip().split(',')
+    validator = RowValidator(KEY_COLUMN_LIST, rejections)
+    fields_iter = iter_line_fields(islice(read_data, 1, None), header, LOAD_COLUMN_LIST)
+    return collect_valid_rows(fields_iter, validator,
+                              lambda row, fields: OrganisationRecord.from_row(row, fields[7], fields[8], fields[9]),
+                              attrgetter('organisation_id'), rejections)
+
+
+def collect_valid_rows(fields_iter, validator: RowValidator, row_factory, id_getter,
+                       rejections: RejectionReport = None) -> list:
+    # row_factory(validated row, fields) of each valid row, without the rows whose organisation id appears more
+    # than once. id_getter reads the organisation id back from a built row
+    row_list = []
+    # every organisation id is counted in a compact id table, valid rows keep the code of their id
+    id_table = OrganisationIdTable()
+    id_batch = []
+    invalid_index_list = []
+    code_list = []
+    for fields in fields_iter:
         # get organisation id
-        organisation_id = data_dict['organisation id']
-        if organisation_id not in organisation_id_set:
-            organisation_id_set.add(organisation_id)
-        elif organisation_id not in organisation_duplicate_id_set:
-            organisation_duplicate_id_set.add(organisation_id)
+        id_batch.append(validator.get_organisation_id(fields))
         # ignore invalid data
-        if invalid_data(data_dict):
-            continue
-        # add valid data
-        data_list.append(data_dict)
+        row = validator.validate(fields)
+        if row is None:
+            invalid_index_list.append(len(id_batch) - 1)
+        else:
+            # add valid data
+            row_list.append(row_factory(row, fields))
+        if len(id_batch) >= ID_BATCH_SIZE:
+            add_organisation_id_batch(id_table, id_batch, invalid_index_list, code_list)
+    add_organisation_id_batch(id_table, id_batch, invalid_index_list, code_list)
     # omit duplicate organisation id datas
-    if len(organisation_duplicate_id_set) > 0:
-        print("Duplicate organisation id:{}".format(organisation_duplicate_id_set))
-        data_list = [x for x in data_list if x['organisation id'] not in organisation_duplicate_id_set]
-    return data_list
+    return omit_duplicate_organisation_id(row_list, id_table, code_list, id_getter, rejections)
 
 
-def invalid_data(data_dict: dict) -> bool:
-    # check country
-    if 'country' not in data_dict.keys() or len(data_dict['country']) == 0:
-        print("Invalid country, data:{}".format(data_dict))
-        return True
-    # check category
-    if 'category' not in data_dict.keys() or len(data_dict['category']) == 0:
-        print("Invalid category, data:{}".format(data_dict))
-        return True
-    # check organisation id, alphanumeric only
-    if ('organisation id' not in data_dict.keys()
-            or len(data_dict['organisation id']) == 0
-            or not data_dict['organisation id'].isalnum()):
-        print("Invalid organisation id, data:{}".format(data_dict))
-        return True
-    # check number of employees, integer only
-    if ('number of employees' not in data_dict.keys()
-            or len(data_dict['number of employees']) == 0
-            or not data_dict['number of employees'].isnumeric()):
-        print("Invalid number of employees, data:{}".format(data_dict))
-        return True
-    # check median salary, float only
-    if ('median salary' not in data_dict.keys()
-            or len(data_dict['median salary']) == 0
-            or not is_float(data_dict['median salary'])):
-        print("Invalid median salary, data:{}".format(data_dict))
-        return True
-    # check profits in 2020(million), float only
-    if ('profits in 2020(million)' not in data_dict.keys()
-            or len(data_dict['profits in 2020(million)']) == 0
-            or not is_float(data_dict['profits in 2020(million)'])):
-        print("Invalid profits in 2020(million), data:{}".format(data_dict))
-        return True
-    # check profits in 2021(million), float only
-    if ('profits in 2021(million)' not in data_dict.keys()
-            or len(data_dict['profits in 2021(million)']) == 0
-            or not is_float(data_dict['profits in 2021(million)'])):
-        print("Invalid profits in 2021(million), data:{}".format(data_dict))
-        return True
-    return False
+def add_organisation_id_batch(id_table: OrganisationIdTable, id_batch: list, invalid_index_list: list,
+                              code_list: list) -> None:
+    # count the ids of the batch and keep the codes of its valid rows, then empty the batch
+    if len(id_batch) > 0:
+        code_list.append(np.delete(id_table.add_list(id_batch), invalid_index_list))
+    id_batch.clear()
+    invalid_index_list.clear()
+
+
+def omit_duplicate_organisation_id(row_list: list, id_table: OrganisationIdTable, code_list: list, id_getter,
+                                   rejections: RejectionReport = None) -> list:
+    # drop the rows whose id is counted more than once. code_list holds the id code of each row (0 when the id
+    # table keeps the id as a string), the rows are selected with a mask instead of a lookup per row
+    if len(code_list) == 0 or id_table.get_duplicate_size() == 0:
+        return row_list
+    code = np.concatenate(code_list)
+    duplicate = id_table.get_code_count(code) > 1
+    for i in np.flatnonzero(code == 0).tolist():
+        duplicate[i] = id_table.get_count(id_getter(row_list[i])) > 1
+    if rejections is not None:
+        for i in np.flatnonzero(duplicate).tolist():
+            rejections.duplicate(row_list[i])
+    return list(compress(row_list, (~duplicate).tolist()))
+
+
+def invalid_data(data_dict: dict, rejection_sink=None) -> bool:
+    # kept for callers that check a single row dictionary, the checks are the ones of RowValidator
+    validator = RowValidator(list(data_dict.keys()), lambda column, fields: reject_data(rejection_sink, column,
+                                                                                       fields))
+    return validator.check(list(data_dict.values())) is None
+
+
+def reject_data(rejection_sink, column: str, data) -> None:
+    # rows are handed over as they are, nothing is formatted per row
+    if rejection_sink is not None:
+        rejection_sink(column, data)
 
 
 def is_float(input_string: str) -> bool:
@@ -117,37 +280,38 @@ def save_data_in_dict(data_list: list, key_name: str) -> dict:
 def t_test_score_minkowski_distance(data_dict: dict) -> dict:
     country_dict = {}
     for country, country_data_list in data_dict.items():
-        # calculate t_test score
-        t_test_score = cal_t_test_score(country_data_list)
-        # calculate Minkowski distance
-        minkowski_distance = cal_minkowski_distance(country_data_list, 3)
-        country_dict[country] = [t_test_score, minkowski_distance]
+        country_dict[country] = cal_country_result(country_data_list)
     return country_dict
 
 
-def cal_t_test_score(data_list: list) -> float:
-    # get profits list
-    profit_2020_list = [float(x['profits in 2020(million)']) for x in data_list]
-    profit_2021_list = [float(x['profits in 2021(million)']) for x in data_list]
-    # sample size
-    number_of_employees_size = len(profit_2020_list)
-    if number_of_employees_size == 0:
+def cal_country_result(country_data_list: list) -> list:
+    # accumulate the country data in a single pass
+    accumulator = cal_country_accumulator(country_data_list, 3)
+    # calculate t_test score
+    t_test_score = cal_t_test_score(accumulator)
+    # calculate Minkowski distance
+    minkowski_distance = cal_minkowski_distance(accumulator, 3)
+    return [t_test_score, minkowski_distance]
+
+
+def cal_country_accumulator(data_list: list, similarity: int) -> CountryAccumulator:
+    accumulator = CountryAccumulator(similarity)
+    # the rows are typed when they are validated
+    for x in data_list:
+        accumulator.add(x['number of employees'], x['median salary'], x['profits in 2020(million)'],
+                        x['profits in 2021(million)'])
+    return accumulator
+
+
+def cal_t_test_score(accumulator: CountryAccumulator) -> float:
+    # sample size, both profit columns have the same size
+    size = accumulator.get_count()
+    if size == 0:
         print("number_of_employees is 0, can not calculate t_test score")
         return 0
-    median_salary_size = len(profit_2021_list)
-    if median_salary_size == 0:
-        print("median_salary is 0, can not calculate t_test score")
-        return 0
-    # sample mean
-    number_of_employees_mean = sum(profit_2020_list) / number_of_employees_size
-    median_salary_mean = sum(profit_2021_list) / median_salary_size
-    # sample standard deviation
-    number_of_employees_sd = calculate_sd(profit_2020_list)
-    median_salary_sd = calculate_sd(profit_2021_list)
-    # calculate t-test score
-    molecule = number_of_employees_mean - median_salary_mean
-    denominator = (
-                          number_of_employees_sd ** 2 / number_of_employees_size + median_salary_sd ** 2 / median_salary_size) ** 0.5
+    # calculate t-test score from the running means and variances
+    molecule = accumulator.get_profit_2020_mean() - accumulator.get_profit_2021_mean()
+    denominator = (accumulator.get_profit_2020_variance() / size + accumulator.get_profit_2021_variance() / size) ** 0.5
     return round(molecule / denominator, 4) if denominator != 0 else 0
 
 
@@ -164,82 +328,1017 @@ def calculate_sd(data_list: list) -> float:
     return (diff_sq_sum / (length - 1)) ** 0.5
 
 
-def cal_minkowski_distance(data_list: list, similarity: int) -> float:
+def cal_minkowski_distance(accumulator: CountryAccumulator, similarity: int) -> float:
     if similarity == 0:
         print("similarity is 0, can not calculate Minkowski distance")
         return 0
-    # get number of employees list and median salary list
-    number_of_employees_list = [int(x['number of employees']) for x in data_list]
-    median_salary_list = [float(x['median salary']) for x in data_list]
-    # calculate Minkowski distance
-    distance_list = []
-    for i in range(len(number_of_employees_list)):
-        distance_list.append((abs(number_of_employees_list[i] - median_salary_list[i])) ** similarity)
-    return round(sum(distance_list) ** (1 / similarity), 4)
+    if similarity != accumulator.get_similarity():
+        print("similarity is {}, but the accumulator is built with {}".format(similarity,
+                                                                            accumulator.get_similarity()))
+        return 0
+    # calculate Minkowski distance from the running power sum
+    return round(accumulator.get_distance_power_sum() ** (1 / similarity), 4)
 
 
-def category_dictionary(data_dict: dict) -> dict:
+def category_dictionary(data_dict: dict, top_k: int = None) -> dict:
     category_dict = {}
     for category, category_data_list in data_dict.items():
-        # rank of organisation
-        organisation_rank_dict = cal_rank_of_organisation(category_data_list)
-        # get organisation data in the category
-        organisation_dict = save_data_in_dict(category_data_list, "organisation id")
-        for organisation_id, organisation_data_list in organisation_dict.items():
-            # get organisation data, if there are multiple data, use the first one
-            organisation_data = organisation_data_list[0]
-            number_of_employees = int(organisation_data['number of employees'])
-            profit_percent_change = organisation_data['profit_percent_change']
-            rank_of_organisation = organisation_rank_dict[organisation_id]
-            # save data to the organisation dictionary
-            organisation_dict[organisation_id] = [number_of_employees, profit_percent_change, rank_of_organisation]
-        # save data to the category dictionary
-        organisation_dict = dict(sorted(organisation_dict.items(), key=lambda x: x[1][2]))
-        category_dict[category] = organisation_dict
+        # organisations of the category in rank order, only the first top_k when given
+        category_dict[category] = cal_ranked_organisation(category_data_list, top_k)
     return category_dict
 
 
-def cal_rank_of_organisation(category_data_list: list) -> dict:
-    # add profits_change to the data for sorting
-    for data in category_data_list:
-        profit_in_2020 = float(data['profits in 2020(million)'])
-        absolute_profit_change = abs(profit_in_2020 - float(data['profits in 2021(million)']))
-        data['profit_percent_change'] = round(cal_absolute_profit_change(absolute_profit_change, profit_in_2020), 4)
-    # sort by number of employees desc and then profits_change desc
-    rank_list = sorted(category_data_list, key=lambda x: (int(x['number of employees']), x['profit_percent_change']),
-                       reverse=True)
+def iter_organisation_key(category_data_list: list):
+    # (number of employees, profit percent change, organisation id), the input rows are typed and left unchanged
+    for x in category_data_list:
+        yield (x['number of employees'],
+               cal_profit_percent_change(x['profits in 2020(million)'], x['profits in 2021(million)']),
+               x['organisation id'])
+
+
+def cal_ranked_organisation(category_data_list: list, top_k: int = None) -> dict:
+    if top_k is None:
+        # sort once by number of employees desc and then profits_change desc, ties keep the file order
+        organisation_list = sorted(iter_organisation_key(category_data_list), key=itemgetter(0, 1), reverse=True)
+    else:
+        # heap selection keeps only top_k entries, same order as the full sort
+        organisation_list = heapq.nlargest(top_k, iter_organisation_key(category_data_list), key=itemgetter(0, 1))
+    # rank starts from 1
+    return {x[2]: [x[0], x[1], rank] for rank, x in enumerate(organisation_list, 1)}
+
+
+def category_page(category_data_list: list, cursor: tuple = None, limit: int = 100) -> tuple:
+    # one page of the ranked organisations after the cursor, and the cursor of the next page (None at the end)
+    # the cursor is (rank, number of employees, profit percent change, -position) of the last organisation returned
+    last_rank, last_key = (0, None) if cursor is None else (cursor[0], cursor[1:])
+    key_iter = ((x[0], x[1], -position, x[2]) for position, x in enumerate(iter_organisation_key(category_data_list)))
+    if last_key is not None:
+        key_iter = (x for x in key_iter if x[:3] < last_key)
+    organisation_list = heapq.nlargest(limit, key_iter, key=itemgetter(0, 1, 2))
+    page_dict = {x[3]: [x[0], x[1], rank] for rank, x in enumerate(organisation_list, last_rank + 1)}
+    if len(organisation_list) < limit:
+        return page_dict, None
+    return page_dict, (last_rank + len(organisation_list),) + organisation_list[-1][:3]
+
+
+def cal_rank_of_organisation(category_data_list: list, top_k: int = None) -> dict:
     # create the rank dictionary, rank starts from 1
-    rank_dict = {}
-    for i in range(len(rank_list)):
-        rank_dict[rank_list[i]['organisation id']] = i + 1
-    return rank_dict
+    return {organisation_id: data[2]
+            for organisation_id, data in cal_ranked_organisation(category_data_list, top_k).items()}
 
 
 def cal_absolute_profit_change(absolute_profit_change: float, profit_2020: int) -> float:
     return (absolute_profit_change / profit_2020) * 100
 
 
-def main(csvfile):
+def cal_profit_percent_change(profit_2020: float, profit_2021: float) -> float:
+    return round(cal_absolute_profit_change(abs(profit_2020 - profit_2021), profit_2020), 4)
+
+
+def scan_duplicate_organisation_id(csvfile: str) -> set:
+    # only the duplicated ids are kept as strings, every id is counted in a compact id table
+    id_table = OrganisationIdTable()
+    count_organisation_id(iter_mmap_fields(csvfile), id_table)
+    return id_table.get_duplicate_set()
+
+
+def count_organisation_id(fields_iter, id_table: OrganisationIdTable) -> None:
+    while True:
+        id_batch = [fields[0] for fields in islice(fields_iter, ID_BATCH_SIZE)]
+        if len(id_batch) == 0:
+            break
+        id_table.add_list(id_batch)
+
+
+def sort_organisation_id(fields_iter, id_sorter: OrganisationIdSorter, batch_size: int = ID_BATCH_SIZE) -> None:
+    # the id sorter takes the ids batch_size rows at a time and holds the duplicated ids once finished
+    while True:
+        id_batch = [fields[0] for fields in islice(fields_iter, batch_size)]
+        if len(id_batch) == 0:
+            break
+        id_sorter.add_list(id_batch)
+    id_sorter.finish()
+
+
+def stream_file_data(csvfile: str, similarity: int = 3, rejections: RejectionReport = None) -> tuple:
+    # first pass: only organisation ids are kept, so duplicates can be excluded exactly as save_file_data does
+    organisation_duplicate_id_set = scan_duplicate_organisation_id(csvfile)
+    # second pass: feed valid rows straight into the country and category accumulators
+    country_accumulator_dict = {}
+    category_accumulator_dict = {}
+    accumulate_fields(iter_mmap_fields(csvfile), organisation_duplicate_id_set, country_accumulator_dict,
+                      category_accumulator_dict, similarity, rejections)
+    return country_accumulator_dict, category_accumulator_dict
+
+
+def accumulate_fields(fields_iter, organisation_duplicate_id_set: set, country_accumulator_dict: dict,
+                      category_accumulator_dict: dict, similarity: int, rejections: RejectionReport = None,
+                      category_sorter: CategoryRunSorter = None) -> None:
+    # category_sorter takes the category rows instead of category_accumulator_dict when given.
+    # organisation_duplicate_id_set may be any container of the duplicated ids, such as a finished OrganisationIdSorter
+    validator = RowValidator(KEY_COLUMN_LIST, rejections)
+    for fields in fields_iter:
+        # ignore invalid data and duplicate organisation id
+        row = validator.validate(fields)
+        if row is None:
+            continue
+        (organisation_id, country, category, number_of_employees, median_salary, profit_2020, profit_2021) = row
+        if organisation_id in organisation_duplicate_id_set:
+            if rejections is not None:
+                rejections.duplicate(fields)
+            continue
+        # country accumulator
+        if country not in country_accumulator_dict:
+            country_accumulator_dict[country] = CountryAccumulator(similarity)
+        country_accumulator_dict[country].add(number_of_employees, median_salary, profit_2020, profit_2021)
+        if category_sorter is not None:
+            category_sorter.add(category, organisation_id, number_of_employees,
+                                cal_profit_percent_change(profit_2020, profit_2021))
+            continue
+        # category accumulator, organisation id is unique once duplicates are excluded
+        if category not in category_accumulator_dict:
+            category_accumulator_dict[category] = {}
+        category_accumulator_dict[category][organisation_id] = [number_of_employees,
+                                                                cal_profit_percent_change(profit_2020, profit_2021)]
+
+
+def split_file_chunks(csvfile: str, chunk_size: int) -> tuple:
+    # split the file body on line boundaries into byte ranges of about chunk_size bytes
+    chunk_list = []
+    try:
+        with open(csvfile, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None, chunk_list
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = next_line_start(mm, 0)
+                header_line = mm[:start]
+                while start < len(mm):
+                    end = next_line_start(mm, min(start + chunk_size, len(mm)))
+                    chunk_list.append((start, end))
+                    start = end
+    except IOError:
+        print("Cannot open file:[%s]" % csvfile)
+        return None, chunk_list
+    return header_line.decode().lower().strip().split(','), chunk_list
+
+
+def scan_chunk_organisation_id(chunk_args: tuple) -> tuple:
+    # only the codes and counts of the chunk ids go back to the parent, not a set of strings
+    csvfile, start, end = chunk_args
+    id_table = OrganisationIdTable()
+    count_organisation_id(iter_mmap_fields(csvfile, start, end), id_table)
+    return id_table.get_entries()
+
+
+def init_chunk_worker(organisation_duplicate_id_set: set) -> None:
+    # the duplicated ids reach each worker process once, not once per chunk
+    global chunk_duplicate_id_set
+    chunk_duplicate_id_set = organisation_duplicate_id_set
+
+
+def accumulate_chunk_data(chunk_args: tuple) -> tuple:
+    csvfile, chunk_index, start, end, similarity, rejections = chunk_args
+    country_accumulator_dict = {}
+    category_accumulator_dict = {}
+    accumulate_fields(iter_mmap_fields(csvfile, start, end), chunk_duplicate_id_set, country_accumulator_dict,
+                      category_accumulator_dict, similarity, rejections)
+    if rejections is not None:
+        rejections.flush()
+    # each category is sorted in the worker, the parent only merges the sorted runs
+    return country_accumulator_dict, category_runs(category_accumulator_dict, chunk_index), rejections
+
+
+def category_runs(category_accumulator_dict: dict, chunk_index: int) -> dict:
+    # category -> (-number of employees, -profit percent change, sequence, organisation id) in rank order. the
+    # sequence is the row position in the file order of the chunks, so ties keep the file order across chunks
+    category_run_dict = {}
+    sequence_start = chunk_index << 40
+    for category, organisation_dict in category_accumulator_dict.items():
+        category_run_dict[category] = sorted((-data[0], -data[1], sequence_start + i, organisation_id)
+                                             for i, (organisation_id, data) in enumerate(organisation_dict.items()))
+    return category_run_dict
+
+
+def parallel_file_data(csvfile: str, workers: int = None, similarity: int = 3, chunk_size: int = 64 * 1024 * 1024,
+                       rejections: RejectionReport = None) -> tuple:
+    # country accumulators and category -> sorted runs of the chunks, in chunk order
+    country_accumulator_dict = {}
+    category_run_dict = {}
+    header, chunk_list = split_file_chunks(csvfile, chunk_size)
+    if header is None:
+        return country_accumulator_dict, category_run_dict
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # first pass: the id codes of every chunk are counted in one table, so ids seen in more than one chunk are
+        # duplicates as well
+        id_table = OrganisationIdTable()
+        chunk_args_list = [(csvfile, start, end) for start, end in chunk_list]
+        for code, count, fallback_dict in executor.map(scan_chunk_organisation_id, chunk_args_list):
+            id_table.merge_entries(code, count, fallback_dict)
+        organisation_duplicate_id_set = id_table.get_duplicate_set()
+        del id_table
+    # only the duplicated ids are sent to the workers, once per worker when it starts
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_chunk_worker,
+                             initargs=(organisation_duplicate_id_set,)) as executor:
+        # second pass: partial states are merged in file order, so ranking ties keep the file order
+        chunk_rejections_list = [None] * len(chunk_list)
+        if rejections is not None:
+            # each chunk spills to its own part file, the parts are appended in file order afterwards
+            chunk_rejections_list = [RejectionReport(rejections.sample_size, None if rejections.spill_file is None else
+                                                     "{}.part{}".format(rejections.spill_file, i))
+                                     for i in range(len(chunk_list))]
+        chunk_args_list = [(csvfile, i, chunk_list[i][0], chunk_list[i][1], similarity, chunk_rejections_list[i])
+                           for i in range(len(chunk_list))]
+        for chunk_country_dict, chunk_category_run_dict, chunk_rejections in executor.map(accumulate_chunk_data,
+                                                                                           chunk_args_list):
+            if rejections is not None:
+                rejections.merge(chunk_rejections)
+            for country, accumulator in chunk_country_dict.items():
+                if country not in country_accumulator_dict:
+                    country_accumulator_dict[country] = accumulator
+                else:
+                    country_accumulator_dict[country].merge(accumulator)
+            for category, run in chunk_category_run_dict.items():
+                if category not in category_run_dict:
+                    category_run_dict[category] = [run]
+                else:
+                    category_run_dict[category].append(run)
+    return country_accumulator_dict, category_run_dict
+
+
+def accumulated_country_dictionary(country_accumulator_dict: dict) -> dict:
+    country_dict = {}
+    for country, accumulator in country_accumulator_dict.items():
+        country_dict[country] = [cal_t_test_score(accumulator),
+                                 cal_minkowski_distance(accumulator, accumulator.get_similarity())]
+    return country_dict
+
+
+def accumulated_category_dictionary(category_accumulator_dict: dict) -> dict:
+    category_dict = {}
+    for category, organisation_dict in category_accumulator_dict.items():
+        # sort by number of employees desc and then profits_change desc, ties keep the file order
+        rank_list = sorted(organisation_dict.items(), key=lambda x: (x[1][0], x[1][1]), reverse=True)
+        category_dict[category] = {organisation_id: [data[0], data[1], i + 1]
+                                   for i, (organisation_id, data) in enumerate(rank_list)}
+    return category_dict
+
+
+def merged_category_dictionary(category_run_dict: dict) -> dict:
+    # category -> sorted runs from category_runs, merged into ranks without sorting again
+    category_dict = {}
+    for category, run_list in category_run_dict.items():
+        run_iter = run_list[0] if len(run_list) == 1 else heapq.merge(*run_list)
+        category_dict[category] = {x[3]: [-x[0], -x[1], rank] for rank, x in enumerate(run_iter, 1)}
+    return category_dict
+
+
+def main_streaming(csvfile, rejections=None):
+    # check input params
+    if len(csvfile) == 0:
+        print("Please input the valid params")
+        return {}, {}
+    # read file lazily, memory is bounded by the number of countries and categories
+    report = RejectionReport() if rejections is None else rejections
+    country_accumulator_dict, category_accumulator_dict = stream_file_data(csvfile, 3, report)
+    finish_rejections(report, rejections is None)
+    if len(country_accumulator_dict) == 0:
+        print("Input file:[{}] contains no data".format(csvfile))
+        return {}, {}
+    # t_test score and Minkowski distance in each country
+    country_dict = accumulated_country_dictionary(country_accumulator_dict)
+    # nested dictionary with category as key and organisation id as key
+    category_dict = accumulated_category_dictionary(category_accumulator_dict)
+    return country_dict, category_dict
+
+
+def sorted_category_dictionary(category_sorter: CategoryRunSorter, top_k: int = None) -> dict:
+    # nested dictionary built from the merged runs, ranks are assigned while merging
+    category_dict = {}
+    for category, organisation_id, number_of_employees, profit_percent_change, rank in \
+            category_sorter.iter_ranked(top_k):
+        if category not in category_dict:
+            category_dict[category] = {}
+        category_dict[category][organisation_id] = [number_of_employees, profit_percent_change, rank]
+    return category_dict
+
+
+def write_sorted_category(category_sorter: CategoryRunSorter, output_file: str, top_k: int = None,
+                          chunk_size: int = 100000) -> int:
+    # stream the merged runs to a csv of category, organisation id, number of employees, profit percent change and
+    # rank, returns the number of rows written
+    size = 0
+    ranked_iter = category_sorter.iter_ranked(top_k)
+    with open(output_file, 'w', newline='', buffering=4 * 1024 * 1024) as f:
+        f.write(format_csv_rows([CATEGORY_COLUMN_LIST], len(CATEGORY_COLUMN_LIST), True))
+        while True:
+            chunk = list(islice(ranked_iter, chunk_size))
+            if len(chunk) == 0:
+                break
+            f.write(format_csv_rows(chunk, len(CATEGORY_COLUMN_LIST)))
+            size += len(chunk)
+    return size
+
+
+def main_external(csvfile, memory_size=256 * 1024 * 1024, temp_dir=None, output_file=None, top_k=None,
+                  rejections=None):
     # check input params
     if len(csvfile) == 0:
         print("Please input the valid params")
         return {}, {}
-    # read file
-    read_data = read_file(csvfile)
+    # categories are ranked by an external sort, organisations are spilled to sorted run files once memory_size is
+    # used and the runs are merged. with output_file the ranks are streamed to that csv and category_dict is empty.
+    # duplicated ids are found by an external sort of the id codes first. memory_size bounds the id codes of the
+    # first pass and the organisations of the second, on top of that each pass holds a batch of about
+    # memory_size // 256 rows, an accumulator per country and a count per id that is not hex digits. the ranks
+    # are written in batches of the same size
+    report = RejectionReport() if rejections is None else rejections
+    batch_size = max(1024, min(ID_BATCH_SIZE, memory_size // 256))
+    country_accumulator_dict = {}
+    with OrganisationIdSorter(memory_size, temp_dir) as id_sorter, \
+            CategoryRunSorter(memory_size, temp_dir) as category_sorter:
+        sort_organisation_id(iter_mmap_fields(csvfile), id_sorter, batch_size)
+        accumulate_fields(iter_mmap_fields(csvfile), id_sorter, country_accumulator_dict, {}, 3, report,
+                          category_sorter)
+        finish_rejections(report, rejections is None)
+        if len(country_accumulator_dict) == 0:
+            print("Input file:[{}] contains no data".format(csvfile))
+            return {}, {}
+        # t_test score and Minkowski distance in each country
+        country_dict = accumulated_country_dictionary(country_accumulator_dict)
+        if output_file is not None:
+            write_sorted_category(category_sorter, output_file, top_k, batch_size)
+            return country_dict, {}
+        category_dict = sorted_category_dictionary(category_sorter, top_k)
+    return country_dict, category_dict
+
+
+def update_incremental_state(state: IncrementalState, csvfile: str, rejections: RejectionReport = None,
+                             final: bool = False) -> None:
+    # process the complete lines appended since the last update, and the trailing line too when final is set
+    try:
+        f = open(csvfile, 'rb')
+    except IOError:
+        print("Cannot open file:[%s]" % csvfile)
+        return
+    with f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size < state.get_offset():
+            # the file was truncated, start again
+            state.reset()
+        if stat.st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if state.get_offset() > 0 and file_fingerprint(stat, mm, state.get_offset()) != state.get_fingerprint():
+                # the file was replaced or rewritten, start again
+                state.reset()
+            if state.get_offset() == 0:
+                # skip csv header
+                if last_line_end(mm, 0) == 0:
+                    return
+                state.set_offset(next_line_start(mm, 0))
+                state.set_fingerprint(file_fingerprint(stat, mm, state.get_offset()))
+            # a trailing line without a line break may still be written, it is picked up by the next update unless
+            # the caller says the file is complete
+            end = stat.st_size if final else last_line_end(mm, state.get_offset())
+            if end <= state.get_offset():
+                return
+            fingerprint = file_fingerprint(stat, mm, end)
+    state.add_fields(iter_mmap_fields(csvfile, state.get_offset(), end), cal_profit_percent_change, rejections)
+    state.set_offset(end)
+    state.set_fingerprint(fingerprint)
+
+
+def file_fingerprint(stat: os.stat_result, mm: mmap.mmap, offset: int) -> tuple:
+    # (device, inode, hash of the first and the last FINGERPRINT_SIZE bytes before offset). a new file has another
+    # inode, a file rewritten in place differs in its first or last processed bytes. only a rewrite that keeps
+    # both blocks and changes the middle of the processed bytes goes unnoticed
+    content_hash = hashlib.blake2b(digest_size=16)
+    content_hash.update(mm[:min(offset, FINGERPRINT_SIZE)])
+    content_hash.update(mm[max(0, offset - FINGERPRINT_SIZE):offset])
+    return stat.st_dev, stat.st_ino, content_hash.hexdigest()
+
+
+def incremental_result(state: IncrementalState) -> tuple:
+    # only the countries and categories changed since the last result are recomputed
+    for country in state.dirty_country_set:
+        if country in state.country_accumulator_dict:
+            state.country_dict.update(accumulated_country_dictionary(
+                {country: state.country_accumulator_dict[country]}))
+        else:
+            state.country_dict.pop(country, None)
+    for category in state.dirty_category_set:
+        if category in state.category_index_dict:
+            # the rank index is already in rank order, no sort is needed
+            state.category_dict[category] = {organisation_id: [number_of_employees, profit_percent_change, rank]
+                                             for rank, (organisation_id, number_of_employees, profit_percent_change)
+                                             in enumerate(state.category_index_dict[category], 1)}
+        else:
+            state.category_dict.pop(category, None)
+    state.dirty_country_set.clear()
+    state.dirty_category_set.clear()
+    return dict(state.country_dict), dict(state.category_dict)
+
+
+def save_incremental_state(state: IncrementalState, state_file: str) -> None:
+    with open(state_file, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_incremental_state(state_file: str) -> IncrementalState:
+    try:
+        with open(state_file, 'rb') as f:
+            return pickle.load(f)
+    except IOError:
+        print("Cannot open file:[%s]" % state_file)
+        return IncrementalState(KEY_COLUMN_LIST)
+
+
+def main_incremental(csvfile, state, rejections=None, final=False):
+    # check input params
+    if len(csvfile) == 0:
+        print("Please input the valid params")
+        return {}, {}
+    # only rows appended since the last call are read, final=True also reads a last line without a line break
+    update_incremental_state(state, csvfile, rejections, final)
+    return incremental_result(state)
+
+
+def load_file_table(csvfile: str, rejections: RejectionReport = None) -> OrganisationTable:
+    # tokenize the memory mapped file directly, the text lines are never materialised
+    return fields_table(iter_mmap_fields(csvfile), rejections)
+
+
+def fields_table(fields_iter, rejections: RejectionReport = None) -> OrganisationTable:
+    # parse and validate each field once, invalid rows go to the rejection sink
+    validator = RowValidator(KEY_COLUMN_LIST, rejections)
+    return build_table(collect_valid_rows(fields_iter, validator, lambda row, fields: row, itemgetter(0), rejections))
+
+
+def build_table(row_list: list) -> OrganisationTable:
+    # row_list holds the typed tuples returned by RowValidator.validate
+    if len(row_list) == 0:
+        return OrganisationTable([], [], [], [], [], [], [], [], [])
+    (organisation_id_list, country_list, category_list, number_of_employees_list, median_salary_list,
+     profit_2020_list, profit_2021_list) = zip(*row_list)
+    # integer code the key columns, codes follow the first appearance order
+    country_code, country_names = factorise(country_list)
+    category_code, category_names = factorise(category_list)
+    return OrganisationTable(organisation_id_list, country_code, country_names, category_code, category_names,
+                             number_of_employees_list, median_salary_list, profit_2020_list, profit_2021_list)
+
+
+def factorise(value_list: list) -> tuple:
+    value_index_dict = {}
+    code_list = [value_index_dict.setdefault(value, len(value_index_dict)) for value in value_list]
+    return code_list, list(value_index_dict.keys())
+
+
+def round_array(values: np.ndarray, ndigits: int) -> list:
+    # numpy rounds through a scaled value, fix the near half cases with the builtin round so results are identical
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_half_index = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in near_half_index.tolist():
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+
+def group_by_statistics(group_code: np.ndarray, group_size: int, values: np.ndarray) -> tuple:
+    # count, mean and sum of squared differences of every group in one batch
+    count = np.bincount(group_code, minlength=group_size)
+    mean = np.bincount(group_code, weights=values, minlength=group_size) / np.maximum(count, 1)
+    m2 = np.bincount(group_code, weights=(values - mean[group_code]) ** 2, minlength=group_size)
+    return count, mean, m2
+
+
+def group_by_power_sum(group_code: np.ndarray, group_size: int, values: np.ndarray, power: int) -> np.ndarray:
+    return np.bincount(group_code, weights=np.abs(values) ** power, minlength=group_size)
+
+
+def table_country_dictionary(table: OrganisationTable, similarity: int) -> dict:
+    country_dict = {}
+    country_code = table.get_country_code()
+    country_size = len(table.get_country_names())
+    # group statistics of every country at once
+    count, profit_2020_mean, profit_2020_m2 = group_by_statistics(country_code, country_size,
+                                                                  table.get_profits_in_2020_million())
+    count, profit_2021_mean, profit_2021_m2 = group_by_statistics(country_code, country_size,
+                                                                  table.get_profits_in_2021_million())
+    distance_power_sum = group_by_power_sum(country_code, country_size,
+                                            table.get_number_of_employees() - table.get_median_salary(), similarity)
+    # t_test score, sample variance is 0 for a single organisation as calculate_sd does
+    variance_size = np.maximum(count - 1, 1)
+    denominator = np.sqrt(profit_2020_m2 / variance_size / count + profit_2021_m2 / variance_size / count)
+    molecule = profit_2020_mean - profit_2021_mean
+    t_test_score = np.divide(molecule, denominator, out=np.zeros(country_size), where=denominator != 0)
+    # Minkowski distance
+    minkowski_distance = distance_power_sum ** (1 / similarity)
+    t_test_score_list = t_test_score.tolist()
+    minkowski_distance_list = minkowski_distance.tolist()
+    for code, country in enumerate(table.get_country_names()):
+        country_dict[country] = [round(t_test_score_list[code], 4), round(minkowski_distance_list[code], 4)]
+    return country_dict
+
+
+def table_category_dictionary(table: OrganisationTable) -> dict:
+    category_dict = {}
+    # profit percent change, same operation order as cal_absolute_profit_change
+    profit_2020 = table.get_profits_in_2020_million()
+    profit_percent_change = round_array((np.abs(profit_2020 - table.get_profits_in_2021_million()) / profit_2020) * 100, 4)
+    # one stable sort: category, then number of employees desc and profits_change desc, ties keep the file order
+    number_of_employees = table.get_number_of_employees()
+    order = np.lexsort((-profit_percent_change, -number_of_employees, table.get_category_code()))
+    category_code = table.get_category_code()[order]
+    group_start_list = np.flatnonzero(np.diff(category_code, prepend=-1)).tolist()
+    group_end_list = group_start_list[1:] + [len(order)]
+    organisation_id_list = table.get_organisation_id()[order].astype(np.str_).tolist()
+    number_of_employees_list = number_of_employees[order].tolist()
+    profit_percent_change_list = profit_percent_change[order].tolist()
+    for start, end in zip(group_start_list, group_end_list):
+        category = table.get_category_names()[category_code[start]]
+        category_dict[category] = dict(zip(organisation_id_list[start:end],
+                                           map(list, zip(number_of_employees_list[start:end],
+                                                         profit_percent_change_list[start:end],
+                                                         range(1, end - start + 1)))))
+    return category_dict
+
+
+def main_columnar(csvfile, rejections=None):
+    # check input params
+    if len(csvfile) == 0:
+        print("Please input the valid params")
+        return {}, {}
+    # tokenize the file and store data in a columnar table
+    report = RejectionReport() if rejections is None else rejections
+    table = load_file_table(csvfile, report)
+    finish_rejections(report, rejections is None)
+    if len(table) == 0:
+        print("Input file:[{}] contains no data".format(csvfile))
+        return {}, {}
+    # t_test score and Minkowski distance in each country
+    country_dict = table_country_dictionary(table, 3)
+    # nested dictionary with category as key and organisation id as key
+    category_dict = table_category_dictionary(table)
+    return country_dict, category_dict
+
+
+def write_snapshot(table: OrganisationTable, snapshot_file: str) -> None:
+    column_dict = {name: getattr(table, name) for name in SNAPSHOT_COLUMN_LIST}
+    # ascii organisation ids take one byte per character instead of four
+    try:
+        column_dict['organisation_id'] = column_dict['organisation_id'].astype(np.bytes_)
+    except UnicodeEncodeError:
+        pass
+    write_snapshot_columns(snapshot_file, table.get_country_names(), table.get_category_names(),
+                           [(name, column_dict[name].dtype, len(column_dict[name]), [column_dict[name]])
+                            for name in SNAPSHOT_COLUMN_LIST])
+
+
+def write_snapshot_columns(snapshot_file: str, country_names: list, category_names: list, column_list: list) -> None:
+    # column_list holds (name, dtype, length, block_iter) in SNAPSHOT_COLUMN_LIST order, block_iter yields the values
+    # of the column a block at a time, so a column does not have to be in memory as a whole
+    # header: magic, json length and json with the key names and the (name, dtype, length, offset) of each column
+    # body: the raw column arrays, each aligned to SNAPSHOT_ALIGNMENT bytes
+    header_column_list = []
+    offset = 0
+    for name, dtype, length, block_iter in column_list:
+        dtype = np.dtype(dtype)
+        header_column_list.append({'name': name, 'dtype': dtype.str, 'length': length, 'offset': offset})
+        offset += -(-dtype.itemsize * length // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+    header = json.dumps({'country_names': country_names, 'category_names': category_names,
+                         'column_list': header_column_list}).encode()
+    body_offset = -(-(len(SNAPSHOT_MAGIC) + 8 + len(header)) // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+    temp_file = "{}.{}.tmp".format(snapshot_file, os.getpid())
+    with open(temp_file, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + len(header).to_bytes(8, 'little') + header)
+        for column, (name, dtype, length, block_iter) in zip(header_column_list, column_list):
+            f.seek(body_offset + column['offset'])
+            for values in block_iter:
+                f.write(np.asarray(values, dtype=dtype).tobytes())
+        f.truncate(body_offset + offset)
+    os.replace(temp_file, snapshot_file)
+
+
+def read_snapshot(snapshot_file: str) -> OrganisationTable:
+    # the columns are read only views over the memory mapped file, nothing is parsed or copied
+    try:
+        with open(snapshot_file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, ValueError):
+        print("Cannot open file:[%s]" % snapshot_file)
+        return None
+    if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        print("Invalid snapshot file:[%s]" % snapshot_file)
+        return None
+    header_length = int.from_bytes(mm[len(SNAPSHOT_MAGIC):len(SNAPSHOT_MAGIC) + 8], 'little')
+    header_start = len(SNAPSHOT_MAGIC) + 8
+    header = json.loads(mm[header_start:header_start + header_length].decode())
+    body_offset = -(-(header_start + header_length) // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+    column_dict = {}
+    for column in header['column_list']:
+        column_dict[column['name']] = np.frombuffer(mm, dtype=np.dtype(column['dtype']), count=column['length'],
+                                                    offset=body_offset + column['offset'])
+    return OrganisationTable(column_dict['organisation_id'], column_dict['country_code'], header['country_names'],
+                             column_dict['category_code'], header['category_names'],
+                             column_dict['number_of_employees'], column_dict['median_salary'],
+                             column_dict['profits_in_2020_million'], column_dict['profits_in_2021_million'])
+
+
+def export_snapshot(csvfile: str, snapshot_file: str, rejections: RejectionReport = None) -> int:
+    # parse and validate the csv once, returns the number of organisations written
+    table = load_file_table(csvfile, rejections)
+    write_snapshot(table, snapshot_file)
+    return len(table)
+
+
+def main_snapshot(snapshot_file):
+    # check input params
+    if len(snapshot_file) == 0:
+        print("Please input the valid params")
+        return {}, {}
+    # the snapshot holds validated and typed data, so it goes straight to the statistics
+    table = read_snapshot(snapshot_file)
+    if table is None or len(table) == 0:
+        print("Input file:[{}] contains no data".format(snapshot_file))
+        return {}, {}
+    # t_test score and Minkowski distance in each country
+    country_dict = table_country_dictionary(table, 3)
+    # nested dictionary with category as key and organisation id as key
+    category_dict = table_category_dictionary(table)
+    return country_dict, category_dict
+
+
+def write_organisations(csvfile: str, organisation_iter, chunk_size: int = 100000,
+                        buffer_size: int = 4 * 1024 * 1024) -> int:
+    # write Organisations or OrganisationRecord objects as csv and return the number of rows written
+    row_getter = attrgetter('organisation_id', 'name', 'website', 'country', 'founded', 'category',
+                            'number_of_employees', 'median_salary', 'profits_in_2020_million',
+                            'profits_in_2021_million')
+    size = 0
+    with open(csvfile, 'w', newline='', buffering=buffer_size) as f:
+        f.write(format_csv_rows([ORGANISATION_COLUMN_LIST], len(ORGANISATION_COLUMN_LIST), True))
+        organisation_iter = iter(organisation_iter)
+        while True:
+            chunk = list(map(row_getter, islice(organisation_iter, chunk_size)))
+            if len(chunk) == 0:
+                break
+            f.write(format_csv_rows(chunk, len(ORGANISATION_COLUMN_LIST)))
+            size += len(chunk)
+    return size
+
+
+def write_table(csvfile: str, table: OrganisationTable, chunk_size: int = 100000,
+                buffer_size: int = 4 * 1024 * 1024) -> int:
+    # write the key columns of an OrganisationTable as csv, chunk_size rows are converted at a time
+    country_names = np.array(table.get_country_names(), dtype=object)
+    category_names = np.array(table.get_category_names(), dtype=object)
+    with open(csvfile, 'w', newline='', buffering=buffer_size) as f:
+        f.write(format_csv_rows([KEY_COLUMN_LIST], len(KEY_COLUMN_LIST), True))
+        for start in range(0, len(table), chunk_size):
+            end = start + chunk_size
+            # every column is converted to text before the rows are formed
+            f.write(format_csv_rows(list(zip(table.get_organisation_id()[start:end].astype(np.str_).tolist(),
+                                             country_names[table.get_country_code()[start:end]].tolist(),
+                                             category_names[table.get_category_code()[start:end]].tolist(),
+                                             number_text(table.get_number_of_employees()[start:end]),
+                                             number_text(table.get_median_salary()[start:end]),
+                                             number_text(table.get_profits_in_2020_million()[start:end]),
+                                             number_text(table.get_profits_in_2021_million()[start:end]))),
+                                    len(KEY_COLUMN_LIST), True))
+    return len(table)
+
+
+def number_text(values: np.ndarray) -> list:
+    # whole numbers are written without the trailing .0, they read back as the same float
+    if values.dtype.kind == 'f' and np.all(np.isfinite(values)) and np.all(values == np.trunc(values)) \
+            and np.all(np.abs(values) < 2 ** 53):
+        values = values.astype(np.int64)
+    return list(map(str, values.tolist()))
+
+
+def format_csv_rows(row_list: list, width: int, text_only: bool = False) -> str:
+    # csv text of rows of width fields, text_only when every field is already a string. rows are joined directly,
+    # the csv writer only quotes the chunk when some field contains a comma, a quote or a line break
+    if text_only:
+        text = "\n".join(map(",".join, row_list))
+    else:
+        text = "\n".join([",".join(map(str, row)) for row in row_list])
+    if (text.count(',') != (width - 1) * len(row_list) or text.count('\n') != len(row_list) - 1
+            or '"' in text or '\r' in text):
+        output = io.StringIO()
+        csv.writer(output, lineterminator='\n').writerows(row_list)
+        return output.getvalue()
+    return text + "\n" if len(row_list) > 0 else ''
+
+
+def create_database_indexes(conn: sqlite3.Connection, commit: bool = True) -> None:
+    # commit=False leaves the indexes in the transaction of the caller
+    cursor = conn.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS organisations_country ON Organisations (country);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS organisations_category ON Organisations (category);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS organisations_organisation_id ON Organisations ("organisation id");')
+    if commit:
+        conn.commit()
+    cursor.close()
+
+
+def database_country_dictionary(conn: sqlite3.Connection, similarity: int) -> dict:
+    country_dict = {}
+    # |number of employees - median salary| ** similarity as a product, similarity is a positive integer
+    distance_power = " * ".join(['abs("number of employees" - "median salary")'] * similarity)
+    # country means first, then the sum of squared differences and the power sum against them, all in sqlite
+    cursor = conn.cursor()
+    cursor.execute('''
+                    WITH CountryMean AS (
+                        SELECT country,
+                               count(*)                          AS size,
+                               avg("profits in 2020(million)")   AS profit_2020_mean,
+                               avg("profits in 2021(million)")   AS profit_2021_mean
+                        FROM Organisations
+                        GROUP BY country
+                    )
+                    SELECT o.country,
+                           m.size,
+                           m.profit_2020_mean,
+                           sum(("profits in 2020(million)" - m.profit_2020_mean)
+                               * ("profits in 2020(million)" - m.profit_2020_mean)),
+                           m.profit_2021_mean,
+                           sum(("profits in 2021(million)" - m.profit_2021_mean)
+                               * ("profits in 2021(million)" - m.profit_2021_mean)),
+                           sum({})
+                    FROM Organisations o
+                    JOIN CountryMean m ON o.country = m.country
+                    GROUP BY o.country;
+                   '''.format(distance_power))
+    for country, size, profit_2020_mean, profit_2020_m2, profit_2021_mean, profit_2021_m2, distance_power_sum \
+            in cursor:
+        accumulator = CountryAccumulator(similarity)
+        accumulator.set_moments(size, profit_2020_mean, profit_2020_m2, profit_2021_mean, profit_2021_m2,
+                                distance_power_sum)
+        country_dict[country] = [cal_t_test_score(accumulator), cal_minkowski_distance(accumulator, similarity)]
+    cursor.close()
+    return country_dict
+
+
+def iter_database_category(conn: sqlite3.Connection, top_k: int = None):
+    # (category, organisation id, number of employees, profit percent change, rank) in rank order, streamed from
+    # the cursor. ties keep the insertion (file) order through rowid. the change is rounded by python's round, as
+    # cal_profit_percent_change does, sqlite's round goes up on some values python rounds down
+    conn.create_function('py_round', 2, round, deterministic=True)
+    cursor = conn.cursor()
+    cursor.execute('''
+                    SELECT category, "organisation id", "number of employees", profit_change, rank
+                    FROM (
+                        SELECT category,
+                               "organisation id",
+                               "number of employees",
+                               profit_change,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY category
+                                   ORDER BY "number of employees" DESC, profit_change DESC, row_id
+                               ) AS rank
+                        FROM (
+                            SELECT category,
+                                   "organisation id",
+                                   "number of employees",
+                                   py_round(abs("profits in 2020(million)" - "profits in 2021(million)")
+                                            / "profits in 2020(million)" * 100, 4) AS profit_change,
+                                   rowid AS row_id
+                            FROM Organisations
+                        )
+                    )
+                    WHERE ? IS NULL OR rank <= ?
+                    ORDER BY category, rank;
+                   ''', (top_k, top_k))
+    yield from cursor
+    cursor.close()
+
+
+def database_category_dictionary(conn: sqlite3.Connection, top_k: int = None) -> dict:
+    category_dict = {}
+    for category, organisation_id, number_of_employees, profit_percent_change, rank in \
+            iter_database_category(conn, top_k):
+        if category not in category_dict:
+            category_dict[category] = {}
+        category_dict[category][organisation_id] = [number_of_employees, profit_percent_change, rank]
+    return category_dict
+
+
+def create_database_table(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("DROP TABLE IF EXISTS Organisations;")
+    cursor.execute('''
+                    CREATE TABLE Organisations
+                    (
+                        "organisation id"          TEXT NOT NULL,
+                        name                       TEXT NOT NULL,
+                        website                    TEXT NOT NULL,
+                        country                    TEXT NOT NULL,
+                        founded                    INTEGER NOT NULL,
+                        category                   TEXT NOT NULL,
+                        "number of employees"      INTEGER NOT NULL,
+                        "median salary"            REAL NOT NULL,
+                        "profits in 2020(million)" REAL NOT NULL,
+                        "profits in 2021(million)" REAL NOT NULL
+                    );
+                   ''')
+
+
+def load_database(csvfile: str, db_file: str, batch_size: int = 100000, rejections: RejectionReport = None) -> int:
+    # replace the Organisations table of db_file with the valid, non duplicated rows of csvfile and return the
+    # number of rows loaded
+    try:
+        f = open(csvfile, 'r')
+    except IOError:
+        print("Cannot open file:[%s]" % csvfile)
+        return 0
+    # first pass: only organisation ids are kept, so duplicates can be excluded exactly as save_file_data does
+    organisation_duplicate_id_set = scan_duplicate_organisation_id(csvfile)
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    # the load is a single transaction written to a write ahead log, a crash half way rolls it back and leaves the
+    # other tables and views of db_file untouched. the log is only synced when it is checkpointed into the file
+    journal_mode = cursor.execute("PRAGMA journal_mode;").fetchone()[0]
+    cursor.execute("PRAGMA journal_mode = WAL;")
+    cursor.execute("PRAGMA synchronous = NORMAL;")
+    cursor.execute("PRAGMA cache_size = -262144;")
+    size = 0
+    try:
+        with f:
+            header = f.readline().lower().strip().split(',')
+            validator = RowValidator(KEY_COLUMN_LIST, rejections)
+            cursor.execute("BEGIN;")
+            create_database_table(cursor)
+            batch = []
+            # second pass: validated rows go into the table batch_size at a time, in file order
+            for fields in iter_line_fields(f, header, LOAD_COLUMN_LIST):
+                # ignore invalid data and duplicate organisation id
+                row = validator.validate(fields)
+                if row is None:
+                    continue
+                if row[0] in organisation_duplicate_id_set:
+                    if rejections is not None:
+                        rejections.duplicate(fields)
+                    continue
+                batch.append(row + (fields[7], fields[8], fields[9]))
+                if len(batch) >= batch_size:
+                    size += insert_database_batch(cursor, batch)
+                    batch = []
+            size += insert_database_batch(cursor, batch)
+            # indexes are built once over the loaded table instead of being maintained per row, in the same
+            # transaction so a failed index rolls the load back and size stays true to the table
+            create_database_indexes(conn, False)
+            conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print("Database:[{}] error:{}".format(db_file, e))
+        size = 0
+    finally:
+        # back to the journal mode db_file had, also after a failed load. the mode can not change inside a
+        # transaction, so one left open by any other error is rolled back first. the log is checkpointed into the
+        # file
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            cursor.execute("PRAGMA journal_mode = {};".format(journal_mode))
+        except sqlite3.Error as e:
+            print("Database:[{}] error:{}".format(db_file, e))
+        cursor.close()
+        conn.close()
+    return size
+
+
+def insert_database_batch(cursor: sqlite3.Cursor, batch: list) -> int:
+    # batch rows are (organisation id, country, category, number of employees, median salary,
+    # profits in 2020(million), profits in 2021(million), name, website, founded)
+    cursor.executemany('''
+                        INSERT INTO Organisations ("organisation id", country, category, "number of employees",
+                                                   "median salary", "profits in 2020(million)",
+                                                   "profits in 2021(million)", name, website, founded)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                       ''', batch)
+    return len(batch)
+
+
+def main_database(db_file, top_k=None, create_indexes=False):
+    # check input params
+    if len(db_file) == 0 or not os.path.exists(db_file):
+        print("Please input the valid params")
+        return {}, {}
+    # the Organisations table holds validated rows without duplicate organisation ids
+    conn = sqlite3.connect(db_file)
+    try:
+        # load_database builds the indexes, a query only writes to db_file when asked to index a table imported
+        # another way
+        if create_indexes:
+            create_database_indexes(conn)
+        country_dict = database_country_dictionary(conn, 3)
+        category_dict = database_category_dictionary(conn, top_k)
+    except sqlite3.Error as e:
+        print("Database:[{}] error:{}".format(db_file, e))
+        return {}, {}
+    finally:
+        conn.close()
+    return country_dict, category_dict
+
+
+def main_parallel(csvfile, workers=None, chunk_size=64 * 1024 * 1024, rejections=None):
+    # check input params
+    if len(csvfile) == 0:
+        print("Please input the valid params")
+        return {}, {}
+    # parse and accumulate file chunks across processes
+    report = RejectionReport() if rejections is None else rejections
+    country_accumulator_dict, category_run_dict = parallel_file_data(csvfile, workers, 3, chunk_size, report)
+    finish_rejections(report, rejections is None)
+    if len(country_accumulator_dict) == 0:
+        print("Input file:[{}] contains no data".format(csvfile))
+        return {}, {}
+    # t_test score and Minkowski distance in each country
+    country_dict = accumulated_country_dictionary(country_accumulator_dict)
+    # nested dictionary with category as key and organisation id as key, merged from the sorted chunk runs
+    category_dict = merged_category_dictionary(category_run_dict)
+    return country_dict, category_dict
+
+
+def finish_rejections(rejections: RejectionReport, print_summary: bool) -> None:
+    rejections.flush()
+    # a single summary line per run instead of one print per rejected row
+    if print_summary and rejections.get_total() > 0:
+        summary = rejections.summary()
+        print("Rejected rows:[{}], reason:{}, column:{}".format(summary['total'], summary['reason'], summary['column']))
+
+
+def run_stage(metrics: StageMetrics, stage: str, rows_in, function, *args):
+    # call function(*args) directly when there are no metrics to record
+    if metrics is None:
+        return function(*args)
+    return metrics.run(stage, rows_in, function, *args)
+
+
+def profile_main(csvfile, profile_file=None, snapshot_file=None, **main_args):
+    # run main once under cProfile and/or tracemalloc, the pstats dump goes to profile_file and the tracemalloc
+    # snapshot to snapshot_file. main_args are passed to main
+    profiler = cProfile.Profile() if profile_file is not None else None
+    start_tracing = snapshot_file is not None and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        result = main(csvfile, **main_args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+        if snapshot_file is not None:
+            tracemalloc.take_snapshot().dump(snapshot_file)
+        if start_tracing:
+            tracemalloc.stop()
+    return result
+
+
+def main(csvfile, rejections=None, top_k=None, lazy=False, cache=None, records=False, metrics=None):
+    # check input params
+    if len(csvfile) == 0:
+        print("Please input the valid params")
+        return {}, {}
+    # cached result of an unchanged file, a rejection report or lazy views need the rows to be read
+    if cache is not None and rejections is None and not lazy:
+        identity = cache.file_identity(csvfile)
+        variant = "main top_k:{}".format(top_k)
+        result = cache.get(csvfile, variant, identity)
+        if result is None:
+            result = main(csvfile, top_k=top_k, metrics=metrics)
+            cache.put(csvfile, variant, identity, result)
+        return result
+    # read file. metrics records the wall time, cpu time, rows and allocations of each stage
+    read_data = run_stage(metrics, 'read', None, read_file, csvfile)
     if read_data is None or len(read_data) == 0:
         print("Input file:[] is empty or not exists".format(csvfile))
         return {}, {}
-    # store data to a list and filter by country
-    data_list = save_file_data(read_data)
+    # store data to a list and filter by country, rejected rows are counted in the report. records keeps each row
+    # as an OrganisationRecord instead of a dictionary, the steps below read both the same way
+    report = RejectionReport() if rejections is None else rejections
+    data_list = run_stage(metrics, 'validate', len(read_data) - 1, save_file_records if records else save_file_data,
+                          read_data, report)
+    finish_rejections(report, rejections is None)
     if len(data_list) == 0:
         print("Input file:[] contains no data".format(csvfile))
         return {}, {}
+    # lazy views compute a country or a category when it is first accessed
+    if lazy:
+        country_dict = LazyResultView(run_stage(metrics, 'group country', len(data_list), save_data_in_dict,
+                                                data_list, "country"), cal_country_result)
+        category_dict = LazyResultView(run_stage(metrics, 'group category', len(data_list), save_data_in_dict,
+                                                 data_list, "category"),
+                                       lambda category_data_list: cal_ranked_organisation(category_data_list, top_k))
+        return country_dict, category_dict
     # store data in a dictionary with country as key
-    data_dict = save_data_in_dict(data_list, "country")
+    data_dict = run_stage(metrics, 'group country', len(data_list), save_data_in_dict, data_list, "country")
     # t_test score and Minkowski distance in each country
-    country_dict = t_test_score_minkowski_distance(data_dict)
+    country_dict = run_stage(metrics, 'statistics', len(data_list), t_test_score_minkowski_distance, data_dict)
     # store data in a dictionary with category as key
-    data_dict = save_data_in_dict(data_list, "category")
-    # nested dictionary with category as key and organisation id as key
-    category_dict = category_dictionary(data_dict)
+    data_dict = run_stage(metrics, 'group category', len(data_list), save_data_in_dict, data_list, "category")
+    # nested dictionary with category as key and organisation id as key, top_k keeps the first organisations only
+    category_dict = run_stage(metrics, 'rank', len(data_list), category_dictionary, data_dict, top_k)
     return country_dict, category_dict
@@ -1,14 +1,26 @@
 import math
+import json
 import os
+import asyncio
 import csv
+import pstats
 import random
 import sqlite3
 import numpy as np
 import scipy.stats as stats
+from domain.CategoryRunSorter import ITEM_SIZE as CATEGORY_RUN_ITEM_SIZE
 from domain.Organisations import Organisations
+from domain.RankIndex import RankIndex
+from domain.ResultCache import ResultCache
 from faker import Faker
 import string
+import sys
+from urllib.parse import quote
+import tracemalloc
 import solution as solution
+import generator
+import server
+import benchmark
 
 default_csvfile = "./Organisations.csv"
 default_db = "./Organisations.db"
@@ -177,6 +189,23 @@ def invalid(data_dict: dict) -> bool:
         return True
 
 
+def expected_invalid_data(data_dict: dict) -> bool:
+    # the original checks, independent of RowValidator
+    for column in ['country', 'category']:
+        if len(data_dict.get(column, '')) == 0:
+            return True
+    if not data_dict.get('organisation id', '').isalnum():
+        return True
+    if not data_dict.get('number of employees', '').isnumeric():
+        return True
+    for column in ['median salary', 'profits in 2020(million)', 'profits in 2021(million)']:
+        try:
+            float(data_dict.get(column, ''))
+        except ValueError:
+            return True
+    return False
+
+
 def get_duplicated_organisation_id(csvfile: str) -> set:
     with open(csvfile, 'r') as f:
         read_data = f.readlines()
@@ -661,6 +690,56 @@ def run_test_case(csvfile: str = default_csvfile) -> None:
     conn.close()
 
 
+def check_same_result(expected_result: tuple, actual_result: tuple, tolerance: float = 1e-4) -> None:
+    expected_country_dict, expected_category_dict = expected_result
+    actual_country_dict, actual_category_dict = actual_result
+    # country dictionary
+    assert expected_country_dict.keys() == actual_country_dict.keys(), "country keys are not the same"
+    for country, expected_data in expected_country_dict.items():
+        actual_data = actual_country_dict[country]
+        for i in range(len(expected_data)):
+            assert abs(expected_data[i] - actual_data[i]) <= tolerance, "country:[{}], expected:[{}], actual:[{}]".format(
+                country, expected_data, actual_data)
+    # category dictionary, rank order included
+    assert expected_category_dict.keys() == actual_category_dict.keys(), "category keys are not the same"
+    for category, expected_data in expected_category_dict.items():
+        assert list(expected_data.items()) == list(actual_category_dict[category].items()), \
+            "category:[{}], expected:[{}], actual:[{}]".format(category, expected_data, actual_category_dict[category])
+
+
+def check_engine_files(engine) -> None:
+    # compare the engine with solution.main on the default file and the special files
+    check_file_list = [default_csvfile]
+    duplicate_organisation_id_file = "./engine_duplicate_organisation_id.csv"
+    write_data = [get_headers()]
+    organisations_record_1 = fake_organisations_data()
+    write_data.append(organisations_record_1.__str__())
+    write_data.append(organisations_record_1.__str__())
+    organisations_record_1.set_number_of_employees("invalid")
+    write_data.append(organisations_record_1.__str__())
+    write_data.append(fake_organisations_data().__str__())
+    write_data.append("\n")
+    with open(default_csvfile, 'r') as f:
+        write_data.extend(f.readlines()[1:])
+    with open(duplicate_organisation_id_file, 'w') as f:
+        f.writelines(write_data)
+    check_file_list.append(duplicate_organisation_id_file)
+    empty_with_header_file = "./engine_empty_with_header.csv"
+    with open(empty_with_header_file, 'w') as f:
+        f.write(get_headers())
+    check_file_list.append(empty_with_header_file)
+    # \r and \r\n line breaks, text mode reading splits lines on both
+    carriage_return_file = "./engine_carriage_return.csv"
+    with open(carriage_return_file, 'w', newline='') as f:
+        f.write("".join(write_data).replace("\n", "\r", 200).replace("\n", "\r\n", 200))
+    check_file_list.append(carriage_return_file)
+    for csvfile in check_file_list:
+        check_same_result(solution.main(csvfile), engine(csvfile))
+    os.remove(duplicate_organisation_id_file)
+    os.remove(empty_with_header_file)
+    os.remove(carriage_return_file)
+
+
 # test 1: test one case
 def test_one_case() -> None:
     print("\nstart testing one case\n")
@@ -697,6 +776,803 @@ def test_edge_cases() -> None:
         os.remove("cleaned.csv")
 
 
+# test 4: streaming engine
+def test_streaming_engine() -> None:
+    print("\nstart testing streaming engine\n")
+    check_engine_files(solution.main_streaming)
+    print("finish testing streaming engine")
+
+
+# test 5: country accumulator against the list based statistics
+def test_country_accumulator() -> None:
+    print("\nstart testing country accumulator\n")
+    profit_2020_list = [random.randint(1, 1000000) for _ in range(100)]
+    profit_2021_list = [random.randint(1, 1000000) for _ in range(100)]
+    number_of_employees_list = [random.randint(1, 1000) for _ in range(100)]
+    median_salary_list = [random.randint(1, 1000000) for _ in range(100)]
+    accumulator = solution.CountryAccumulator(3)
+    for i in range(100):
+        accumulator.add(number_of_employees_list[i], median_salary_list[i], profit_2020_list[i], profit_2021_list[i])
+    expected_t_test_score = round(stats.ttest_ind(profit_2020_list, profit_2021_list)[0], 4)
+    assert abs(expected_t_test_score - solution.cal_t_test_score(accumulator)) <= 1e-4, "t_test_score is not correct"
+    assert abs(solution.calculate_sd(profit_2020_list) ** 2 - accumulator.get_profit_2020_variance()) <= 1e-4 * \
+           accumulator.get_profit_2020_variance(), "variance is not correct"
+    expected_distance = round(np.linalg.norm(np.array(number_of_employees_list) - np.array(median_salary_list), ord=3), 4)
+    assert abs(expected_distance - solution.cal_minkowski_distance(accumulator, 3)) <= 1e-4, "distance is not correct"
+    # empty accumulator
+    assert solution.cal_t_test_score(solution.CountryAccumulator(3)) == 0, "empty t_test_score is not 0"
+    print("finish testing country accumulator")
+
+
+# test 6: columnar engine
+def test_columnar_engine() -> None:
+    print("\nstart testing columnar engine\n")
+    check_engine_files(solution.main_columnar)
+    print("finish testing columnar engine")
+
+
+# test 7: parallel engine, small chunks so that duplicate organisation ids span chunks
+def test_parallel_engine() -> None:
+    print("\nstart testing parallel engine\n")
+    check_engine_files(lambda csvfile: solution.main_parallel(csvfile, workers=2, chunk_size=64))
+    print("finish testing parallel engine")
+
+
+# test 8: compiled row validator against invalid_data
+def test_row_validator() -> None:
+    print("\nstart testing row validator\n")
+    header = get_headers().strip().split(',')
+    value_list = ['', '1', '12', '-3', '+4', '1.5', '.5', '5.', '1e5', '1E-5', '1_000', '1__0', '_1', 'nan', 'inf',
+                  '-infinity', 'abc', '1.2.3', ' 7', 'e5', '0x1f', '١٢', '\t8 ', '\u20039\xa0', '\x1c1', '1\x1f',
+                  '1\x1e5', '\x85nan']
+    base_data = fake_organisations_data().__str__().strip().split(',')
+    for column in ['organisation id', 'country', 'category', 'number of employees', 'median salary',
+                   'profits in 2020(million)', 'profits in 2021(million)']:
+        for value in value_list:
+            data = list(base_data)
+            data[header.index(column)] = value
+            rejection_list = []
+            validator = solution.RowValidator(header, lambda x, y: rejection_list.append(x))
+            row = validator.validate(data)
+            expected_invalid = expected_invalid_data(dict(zip(header, data)))
+            assert expected_invalid == (row is None), "column:[{}], value:[{}], expected invalid:[{}]".format(
+                column, value, expected_invalid)
+            assert rejection_list == ([column] if expected_invalid else []), "rejection sink is not correct"
+            assert solution.invalid_data(dict(zip(header, data))) == expected_invalid, "invalid_data is not correct"
+            # check accepts the same rows and keeps the strings
+            checked_row = solution.RowValidator(header).check(data)
+            assert (checked_row is None) == (row is None), "check and validate do not agree"
+            assert checked_row is None or checked_row[3] == data[header.index('number of employees')], \
+                "check converts the fields"
+    # short row
+    assert solution.RowValidator(header).validate(base_data[:5]) is None, "short row is not rejected"
+    print("finish testing row validator")
+
+
+# test 9: rejection report
+def test_rejection_report() -> None:
+    print("\nstart testing rejection report\n")
+    rejection_file = "./rejection_report.csv"
+    spill_file = "./rejection_report.jsonl"
+    for file in [rejection_file, spill_file]:
+        if os.path.exists(file):
+            os.remove(file)
+    write_data = [get_headers()]
+    organisations_record_1 = fake_organisations_data()
+    write_data.append(organisations_record_1.__str__())
+    write_data.append(organisations_record_1.__str__())
+    for i in range(3):
+        write_data.append(fake_organisations_data(country="test_country", median_salary=-1).__str__().replace(
+            "test_country", ""))
+    organisations_record_2 = fake_organisations_data()
+    organisations_record_2.set_profits_in_2021_million("invalid")
+    write_data.append(organisations_record_2.__str__())
+    write_data.append(fake_organisations_data().__str__())
+    with open(rejection_file, 'w') as f:
+        f.writelines(write_data)
+    database_file = "./rejection_report.db"
+    engine_list = [solution.main, solution.main_streaming, solution.main_columnar,
+                   lambda csvfile, rejections: solution.main_parallel(csvfile, 2, 64, rejections),
+                   lambda csvfile, rejections: solution.main(csvfile, rejections, records=True),
+                   lambda csvfile, rejections: solution.main_external(csvfile, rejections=rejections),
+                   lambda csvfile, rejections: solution.main_incremental(
+                       csvfile, solution.IncrementalState(solution.KEY_COLUMN_LIST), rejections, final=True),
+                   lambda csvfile, rejections: solution.load_database(csvfile, database_file, rejections=rejections)]
+    for engine in engine_list:
+        rejections = solution.RejectionReport(sample_size=2, spill_file=spill_file)
+        engine(rejection_file, rejections=rejections)
+        rejections.flush()
+        summary = rejections.summary()
+        assert summary['total'] == 6, "total rejection is not correct, actual:[{}]".format(summary)
+        assert rejections.get_count('duplicate') == 2, "duplicate rejection is not correct"
+        assert rejections.get_count(column='country') == 3, "country rejection is not correct"
+        assert rejections.get_count('invalid', 'profits in 2021(million)') == 1, "profit rejection is not correct"
+        assert len(summary['sample']) == 2, "sample size is not bounded"
+        with open(spill_file, 'r') as f:
+            spill_list = [json.loads(x) for x in f.readlines()]
+        assert len(spill_list) == 6, "spill file is not correct"
+        # every engine records a row as the key columns and their strings, whatever the reason
+        for row in [x['row'] for x in summary['sample'] + spill_list]:
+            assert list(row) == solution.KEY_COLUMN_LIST and all(isinstance(x, str) for x in row.values()), \
+                "rejected row:[{}] does not have the row shape".format(row)
+        assert [x['row']['country'] for x in spill_list if x['column'] == 'country'] == [''] * 3, \
+            "rejected row values are not correct"
+        assert {x['row']['organisation id'] for x in spill_list if x['reason'] == 'duplicate'} == \
+            {organisations_record_1.organisation_id.lower()}, "duplicate row values are not correct"
+        os.remove(spill_file)
+    os.remove(rejection_file)
+    os.remove(database_file)
+    print("finish testing rejection report")
+
+
+# test 10: memory mapped tokenizer against the text line tokenizer
+def test_mmap_tokenizer() -> None:
+    print("\nstart testing mmap tokenizer\n")
+    tokenizer_file = "./mmap_tokenizer.csv"
+    with open(default_csvfile, 'r') as f:
+        read_data = f.readlines()
+    # upper case header and values, blank lines, short rows and trailing spaces
+    write_data = [read_data[0].upper()] + [x.upper() for x in read_data[1:50]] + ["\n", "  \n", "a,b,c\n"]
+    write_data.extend([x.rstrip("\n") + "  \n" for x in read_data[50:]])
+    with open(tokenizer_file, 'w') as f:
+        f.writelines(write_data)
+    header = write_data[0].lower().strip().split(',')
+    expected_fields_list = list(solution.iter_line_fields(write_data[1:], header))
+    actual_fields_list = list(solution.iter_mmap_fields(tokenizer_file))
+    assert expected_fields_list == actual_fields_list, "mmap tokenizer fields are not correct"
+    check_same_result(solution.main(tokenizer_file), solution.main_columnar(tokenizer_file))
+    assert list(solution.iter_mmap_fields("./not_exists.csv")) == [], "missing file should yield nothing"
+    os.remove(tokenizer_file)
+    print("finish testing mmap tokenizer")
+
+
+# test 11: incremental state on appended batches
+def test_incremental_state() -> None:
+    print("\nstart testing incremental state\n")
+    incremental_file = "./incremental.csv"
+    state_file = "./incremental.state"
+    with open(default_csvfile, 'r') as f:
+        read_data = f.readlines()
+    # later batches repeat organisation ids of earlier ones, and the last line is written in two steps
+    batch_list = [read_data[:200], read_data[200:350] + [read_data[10], read_data[20]],
+                  read_data[350:] + [read_data[210], read_data[30]]]
+    with open(incremental_file, 'w') as f:
+        f.write("")
+    state = solution.IncrementalState(solution.KEY_COLUMN_LIST)
+    # rows are reported as main reports them, organisations retracted in a later batch included
+    rejections = solution.RejectionReport()
+    for batch in batch_list:
+        with open(incremental_file, 'a') as f:
+            f.writelines(batch[:-1])
+            f.write(batch[-1][:5])
+        solution.main_incremental(incremental_file, state, rejections)
+        with open(incremental_file, 'a') as f:
+            f.write(batch[-1][5:])
+        # resume from a saved state
+        solution.save_incremental_state(state, state_file)
+        state = solution.load_incremental_state(state_file)
+        check_same_result(solution.main(incremental_file), solution.main_incremental(incremental_file, state,
+                                                                                     rejections))
+    expected_rejections = solution.RejectionReport()
+    solution.main(incremental_file, expected_rejections)
+    assert expected_rejections.get_count('duplicate') > 0, "incremental file should have duplicated ids"
+    for reason in ['invalid', 'duplicate']:
+        assert rejections.get_count(reason) == expected_rejections.get_count(reason), \
+            "incremental %s rejection is not correct" % reason
+    # a longer file written in place of the processed one, then a longer one moved over it
+    for replace in [False, True]:
+        replaced_file = incremental_file + ".tmp" if replace else incremental_file
+        with open(replaced_file, 'w') as f:
+            f.writelines([read_data[0]] + read_data[200:] + read_data[1:200] + read_data[1:60 * (1 + replace)])
+        if replace:
+            os.replace(replaced_file, incremental_file)
+        check_same_result(solution.main(incremental_file), solution.main_incremental(incremental_file, state))
+    # a file that does not end with a line break, the last line is only read once the file is final
+    with open(incremental_file, 'w') as f:
+        f.writelines(read_data[:-1])
+        f.write(read_data[-1].rstrip('\r\n'))
+    state = solution.IncrementalState(solution.KEY_COLUMN_LIST)
+    solution.main_incremental(incremental_file, state)
+    assert state.get_offset() < os.path.getsize(incremental_file), "last line without a line break is read"
+    check_same_result(solution.main(incremental_file), solution.main_incremental(incremental_file, state, final=True))
+    os.remove(incremental_file)
+    os.remove(state_file)
+    print("finish testing incremental state")
+
+
+# test 12: rank index against a full sort
+def test_rank_index() -> None:
+    print("\nstart testing rank index\n")
+    rank_index = RankIndex(load=4)
+    expected_dict = {}
+    for i in range(500):
+        organisation_id = "org{}".format(random.randint(0, 200))
+        if organisation_id in expected_dict and random.random() < 0.3:
+            rank_index.remove(organisation_id)
+            del expected_dict[organisation_id]
+            continue
+        data = [random.randint(1, 20), round(random.uniform(0, 5), 1)]
+        rank_index.insert(organisation_id, data[0], data[1])
+        expected_dict.pop(organisation_id, None)
+        expected_dict[organisation_id] = data
+    # sort by number of employees desc and then profits_change desc, ties keep the insertion order
+    expected_list = sorted(expected_dict.items(), key=lambda x: (x[1][0], x[1][1]), reverse=True)
+    assert [(x[0], x[1][0], x[1][1]) for x in expected_list] == list(rank_index), "rank order is not correct"
+    for i in range(len(expected_list)):
+        assert rank_index.rank(expected_list[i][0]) == i + 1, "rank is not correct"
+    assert rank_index.top(5) == list(rank_index)[:5], "top k is not correct"
+    assert rank_index.rank("not_exists") is None, "missing organisation rank is not None"
+    print("finish testing rank index")
+
+
+# test 13: category dictionary does not change the input rows
+def test_category_dictionary_input() -> None:
+    print("\nstart testing category dictionary input\n")
+    data_list = solution.save_file_data(solution.read_file(default_csvfile))
+    expected_data_list = [dict(x) for x in data_list]
+    category_dict = solution.category_dictionary(solution.save_data_in_dict(data_list, "category"))
+    assert data_list == expected_data_list, "input rows are changed"
+    for category, organisation_dict in category_dict.items():
+        assert [x[2] for x in organisation_dict.values()] == list(range(1, len(organisation_dict) + 1)), \
+            "category:[{}], organisations are not in rank order".format(category)
+    print("finish testing category dictionary input")
+
+
+# test 14: top k and paginated category output
+def test_category_top_k() -> None:
+    print("\nstart testing category top k\n")
+    expected_category_dict = solution.main(default_csvfile)[1]
+    for top_k in [1, 3, 1000]:
+        actual_category_dict = solution.main(default_csvfile, top_k=top_k)[1]
+        for category, organisation_dict in expected_category_dict.items():
+            assert list(organisation_dict.items())[:top_k] == list(actual_category_dict[category].items()), \
+                "category:[{}], top {} is not correct".format(category, top_k)
+    data_dict = solution.save_data_in_dict(solution.save_file_data(solution.read_file(default_csvfile)), "category")
+    # ties on number of employees and profit change have to page in file order
+    data_dict['tie'] = [fake_organisations_data(category='tie', number_of_employees=5, profits_in_2020_million=10,
+                                                profits_in_2021_million=20) for _ in range(7)]
+    data_dict['tie'] = solution.save_file_data([get_headers()] + [x.__str__() for x in data_dict['tie']])
+    for category, category_data_list in data_dict.items():
+        expected_organisation_dict = solution.cal_ranked_organisation(category_data_list)
+        actual_organisation_dict = {}
+        page_dict, cursor = solution.category_page(category_data_list, limit=2)
+        actual_organisation_dict.update(page_dict)
+        while cursor is not None:
+            page_dict, cursor = solution.category_page(category_data_list, cursor, limit=2)
+            actual_organisation_dict.update(page_dict)
+        assert list(expected_organisation_dict.items()) == list(actual_organisation_dict.items()), \
+            "category:[{}], pages are not correct".format(category)
+    print("finish testing category top k")
+
+
+# test 15: lazy result views
+def test_lazy_result_view() -> None:
+    print("\nstart testing lazy result view\n")
+    expected_result = solution.main(default_csvfile)
+    country_view, category_view = solution.main(default_csvfile, lazy=True)
+    assert country_view.get_computed_size() == 0 and category_view.get_computed_size() == 0, "views are not lazy"
+    country = next(iter(expected_result[0]))
+    assert country_view[country] == expected_result[0][country], "country result is not correct"
+    assert country_view.get_computed_size() == 1, "only the accessed country should be computed"
+    assert country_view[country] is country_view[country], "country result is not memoised"
+    check_same_result(expected_result, (country_view, category_view))
+    assert dict(category_view) == expected_result[1], "category view is not correct"
+    print("finish testing lazy result view")
+
+
+# test 16: result cache
+def test_result_cache() -> None:
+    print("\nstart testing result cache\n")
+    cache_dir = "./result_cache"
+    cache_file = "./result_cache.csv"
+    with open(default_csvfile, 'r') as f:
+        read_data = f.readlines()
+    with open(cache_file, 'w') as f:
+        f.writelines(read_data[:300])
+    cache = ResultCache(cache_dir)
+    cache.clear()
+    expected_result = solution.main(cache_file)
+    assert solution.main(cache_file, cache=cache) == expected_result, "cache miss result is not correct"
+    assert len(os.listdir(cache_dir)) == 1, "result is not cached"
+    assert solution.main(cache_file, cache=cache) == expected_result, "cache hit result is not correct"
+    # a caller changing its result does not change the cached one
+    solution.main(cache_file, cache=cache)[0].clear()
+    next(iter(solution.main(cache_file, cache=cache)[1].values())).clear()
+    assert solution.main(cache_file, cache=cache) == expected_result, "cached result is changed by a caller"
+    # an edit that keeps the size and the modification time
+    stat = os.stat(cache_file)
+    header = get_headers().strip().split(',')
+    edited_data = read_data[150].strip().split(',')
+    profit_2020_index = header.index('profits in 2020(million)')
+    profit_2021_index = header.index('profits in 2021(million)')
+    edited_data[profit_2020_index], edited_data[profit_2021_index] = \
+        edited_data[profit_2021_index], edited_data[profit_2020_index]
+    with open(cache_file, 'w') as f:
+        f.writelines(read_data[:150] + [",".join(edited_data) + "\n"] + read_data[151:300])
+    assert os.path.getsize(cache_file) == stat.st_size, "edited file size is changed"
+    os.utime(cache_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    edited_result = solution.main(cache_file)
+    assert edited_result != expected_result and solution.main(cache_file, cache=cache) == edited_result, \
+        "edited file is not recomputed"
+    # a changed file invalidates the entry
+    with open(cache_file, 'a') as f:
+        f.writelines(read_data[300:])
+    assert solution.main(cache_file, cache=cache) == solution.main(cache_file), "changed file is not recomputed"
+    # least recently used entries are evicted above the size cap
+    cache.max_size = os.path.getsize(os.path.join(cache_dir, os.listdir(cache_dir)[0])) + 1
+    solution.main(cache_file, top_k=1, cache=cache)
+    assert len(os.listdir(cache_dir)) == 1, "cache size is not capped"
+    cache.clear()
+    os.rmdir(cache_dir)
+    os.remove(cache_file)
+    print("finish testing result cache")
+
+
+# test 17: binary snapshot
+def test_snapshot() -> None:
+    print("\nstart testing snapshot\n")
+    snapshot_file = "./organisations.snapshot"
+    assert solution.export_snapshot(default_csvfile, snapshot_file) > 0, "snapshot is empty"
+    check_same_result(solution.main(default_csvfile), solution.main_snapshot(snapshot_file))
+    table = solution.read_snapshot(snapshot_file)
+    assert not table.get_median_salary().flags.writeable, "snapshot columns are not memory mapped"
+    # empty file with header
+    empty_with_header_file = "./snapshot_empty_with_header.csv"
+    with open(empty_with_header_file, 'w') as f:
+        f.write(get_headers())
+    assert solution.export_snapshot(empty_with_header_file, snapshot_file) == 0, "snapshot is not empty"
+    assert solution.main_snapshot(snapshot_file) == ({}, {}), "empty snapshot result is not empty"
+    del table
+    os.remove(empty_with_header_file)
+    os.remove(snapshot_file)
+    print("finish testing snapshot")
+
+
+# test 18: sqlite engine
+def test_database_engine() -> None:
+    print("\nstart testing database engine\n")
+    database_file = "./database_engine.db"
+    if os.path.exists(database_file):
+        os.remove(database_file)
+    conn = sqlite3.connect(database_file)
+    cursor = conn.cursor()
+    import_data(cursor, conn)
+    cursor.close()
+    conn.close()
+    check_same_result(solution.main(default_csvfile), solution.main_database(database_file))
+    # a query does not write to the database unless asked to create the indexes
+    conn = sqlite3.connect(database_file)
+    index_query = "SELECT count(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Organisations';"
+    assert conn.execute(index_query).fetchone()[0] == 0, "query creates indexes"
+    conn.close()
+    actual_category_dict = solution.main_database(database_file, top_k=2, create_indexes=True)[1]
+    conn = sqlite3.connect(database_file)
+    assert conn.execute(index_query).fetchone()[0] == 3, "indexes are not created"
+    conn.close()
+    for category, organisation_dict in solution.main(default_csvfile, top_k=2)[1].items():
+        assert list(organisation_dict.items()) == list(actual_category_dict[category].items()), \
+            "category:[{}], top k is not correct".format(category)
+    # changes sqlite's round takes up and python's round takes down rank as main ranks them
+    tie_file = "./database_tie.csv"
+    tie_list = [fake_organisations_data(organisation_id=organisation_id, category="cat", number_of_employees=100,
+                                        profits_in_2020_million=100, profits_in_2021_million=profit_2021)
+                for organisation_id, profit_2021 in [("aaa1", 10.00005), ("bbb2", 10.0), ("ccc3", 10.00015)]]
+    with open(tie_file, 'w') as f:
+        f.writelines([get_headers()] + [x.__str__() for x in tie_list])
+    solution.load_database(tie_file, database_file)
+    expected_category_dict = solution.main(tie_file)[1]
+    assert list(expected_category_dict['cat']) == ["bbb2", "aaa1", "ccc3"], "main tie order is not correct"
+    assert list(solution.main_database(database_file)[1]['cat'].items()) == \
+        list(expected_category_dict['cat'].items()), "rounded tie is not ranked as main ranks it"
+    os.remove(tie_file)
+    os.remove(database_file)
+    if os.path.exists("cleaned.csv"):
+        os.remove("cleaned.csv")
+    print("finish testing database engine")
+
+
+# test 19: sqlite bulk loader
+def test_load_database() -> None:
+    print("\nstart testing load database\n")
+    database_file = "./load_database.db"
+
+    def load_engine(csvfile):
+        solution.load_database(csvfile, database_file, batch_size=7)
+        return solution.main_database(database_file)
+
+    check_engine_files(load_engine)
+    rejections = solution.RejectionReport()
+    size = solution.load_database(default_csvfile, database_file, rejections=rejections)
+    conn = sqlite3.connect(database_file)
+    assert conn.execute("SELECT count(*) FROM Organisations;").fetchone()[0] == size, "row count is not correct"
+    index_list = [x[0] for x in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")]
+    assert "organisations_country" in index_list and "organisations_category" in index_list, \
+        "indexes are not created"
+    assert conn.execute("PRAGMA journal_mode;").fetchone()[0] == "delete", "journal mode is not restored"
+    conn.close()
+    # a failed load rolls back and restores the journal mode too
+    os.remove(database_file)
+    conn = sqlite3.connect(database_file)
+    conn.execute("CREATE VIEW Organisations AS SELECT 1 AS x;")
+    conn.close()
+    assert solution.load_database(default_csvfile, database_file) == 0, "failed load size is not 0"
+    conn = sqlite3.connect(database_file)
+    assert conn.execute("PRAGMA journal_mode;").fetchone()[0] == "delete", "journal mode is not restored on error"
+    assert conn.execute("SELECT x FROM Organisations;").fetchall() == [(1,)], "failed load is not rolled back"
+    conn.close()
+    # an index that can not be built rolls the rows back with it
+    os.remove(database_file)
+    conn = sqlite3.connect(database_file)
+    conn.execute("CREATE TABLE organisations_country (x);")
+    conn.close()
+    assert solution.load_database(default_csvfile, database_file) == 0, "failed index load size is not 0"
+    conn = sqlite3.connect(database_file)
+    assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name = 'Organisations';").fetchone()[0] == 0, \
+        "failed index load is not rolled back"
+    conn.close()
+    os.remove(database_file)
+    print("finish testing load database")
+
+
+# test 20: compact organisation records
+def test_organisation_record() -> None:
+    print("\nstart testing organisation record\n")
+    check_engine_files(lambda csvfile: solution.main(csvfile, records=True))
+    with open(default_csvfile, 'r') as f:
+        read_data = f.readlines()
+    record_list = solution.save_file_records(read_data)
+    data_list = solution.save_file_data(read_data)
+    assert len(record_list) == len(data_list), "record count is not correct"
+    for record, data in zip(record_list, data_list):
+        assert record['organisation id'] == data['organisation id'] and record['country'] == data['country'], \
+            "record:[{}] is not correct".format(record.get_organisation_id())
+        assert record.get_number_of_employees() == int(data['number of employees']), "employees are not typed"
+        assert record.get_median_salary() == float(data['median salary']), "median salary is not typed"
+    assert not hasattr(record_list[0], '__dict__'), "record should not have an instance dictionary"
+    print("finish testing organisation record")
+
+
+# test 21: batch csv writer
+def test_write_organisations() -> None:
+    print("\nstart testing write organisations\n")
+    write_file = "./write_organisations.csv"
+    with open(default_csvfile, 'r') as f:
+        read_data = f.readlines()
+    # records and tables written back give the same result
+    expected_result = solution.main(default_csvfile)
+    assert solution.write_organisations(write_file, solution.save_file_records(read_data), chunk_size=7) == \
+        len(solution.save_file_data(read_data)), "record count is not correct"
+    check_same_result(expected_result, solution.main(write_file))
+    assert solution.write_table(write_file, solution.load_file_table(default_csvfile), chunk_size=7) == \
+        len(solution.save_file_data(read_data)), "table row count is not correct"
+    check_same_result(expected_result, solution.main(write_file))
+    # fields with a comma, a quote or a line break are quoted
+    organisations_list = [fake_organisations_data(name='name, with "comma"'), fake_organisations_data(),
+                          fake_organisations_data(website="line\nbreak")]
+    solution.write_organisations(write_file, organisations_list, chunk_size=2)
+    with open(write_file, 'r', newline='') as f:
+        row_list = list(csv.reader(f))
+    assert row_list[0] == solution.ORGANISATION_COLUMN_LIST, "header is not correct"
+    for organisations_record, row in zip(organisations_list, row_list[1:]):
+        assert row == [str(x) for x in [
+            organisations_record.get_organisation_id(), organisations_record.get_name(),
+            organisations_record.get_website(), organisations_record.get_country(),
+            organisations_record.get_founded(), organisations_record.get_category(),
+            organisations_record.get_number_of_employees(), organisations_record.get_median_salary(),
+            organisations_record.get_profits_in_2020_million(), organisations_record.get_profits_in_2021_million()]], \
+            "row:[{}] is not correct".format(row)
+    os.remove(write_file)
+    print("finish testing write organisations")
+
+
+# test 22: synthetic data generator
+def test_generator() -> None:
+    print("\nstart testing generator\n")
+    generator_file = "./generator.csv"
+    generator_snapshot_file = "./generator.snapshot"
+    option_dict = {'seed': 7, 'block_size': 300, 'country_size': 20, 'category_size': 5, 'duplicate_rate': 0.05,
+                   'invalid_rate': 0.05}
+    assert generator.generate_csv(generator_file, 1000, **option_dict) == 1000, "row count is not correct"
+    with open(generator_file, 'r') as f:
+        read_data = f.readlines()
+    assert len(read_data) == 1001, "file length is not correct"
+    # same seed, same file
+    generator.generate_csv(generator_file, 1000, workers=2, **option_dict)
+    with open(generator_file, 'r') as f:
+        assert f.readlines() == read_data, "generated file is not reproducible"
+    rejections = solution.RejectionReport()
+    expected_result = solution.main(generator_file, rejections=rejections)
+    assert rejections.get_count('invalid') > 0 and rejections.get_count('duplicate') > 0, \
+        "invalid and duplicate rows are not generated"
+    # the snapshot holds the rows main keeps from the csv
+    size = generator.generate_snapshot(generator_snapshot_file, 1000, **option_dict)
+    assert size == len(solution.save_file_data(read_data)), "snapshot row count is not correct"
+    check_same_result(expected_result, solution.main_snapshot(generator_snapshot_file))
+    # blocks streamed from two workers give the same snapshot
+    with open(generator_snapshot_file, 'rb') as f:
+        snapshot_data = f.read()
+    generator.generate_snapshot(generator_snapshot_file, 1000, workers=2, **option_dict)
+    with open(generator_snapshot_file, 'rb') as f:
+        assert f.read() == snapshot_data, "generated snapshot is not reproducible"
+    os.remove(generator_file)
+    os.remove(generator_snapshot_file)
+    print("finish testing generator")
+
+
+# test 23: benchmark suite
+def test_benchmark() -> None:
+    print("\nstart testing benchmark\n")
+    data_dir = "./benchmark_test_data"
+    result = benchmark.run_benchmark([1000], ['clean', 'duplicate'], data_dir)
+    assert len(result['case_list']) == 2, "case count is not correct"
+    for case in result['case_list']:
+        assert [x['stage'] for x in case['stage_list']] == [
+            'read_file', 'save_file_data', 'save_data_in_dict country', 't_test_score_minkowski_distance',
+            'save_data_in_dict category', 'category_dictionary'], "stages are not correct"
+        assert case['peak_rss'] > 0 and all(x['wall_time'] >= 0 for x in case['stage_list']), \
+            "measurements are not correct"
+    assert result['case_list'][1]['stage_list'][1]['rows_out'] < 1000, "duplicates are not excluded"
+    # a slower stage is reported as a regression
+    assert benchmark.compare_result(result, result) == [], "same result should not regress"
+    slower_result = json.loads(json.dumps(result))
+    slower_result['case_list'][0]['stage_list'][0]['wall_time'] *= 2
+    regression_list = benchmark.compare_result(result, slower_result)
+    assert len(regression_list) == 1 and regression_list[0]['stage'] == 'read_file', "regression is not reported"
+    # memory is measured per stage where the peak can be reset, so a later stage can regress on its own
+    stage = result['case_list'][0]['stage_list'][-1]
+    if stage['peak_rss_delta'] is not None:
+        assert stage['peak_rss'] <= result['case_list'][0]['peak_rss'], "stage peak is not correct"
+        more_memory_result = json.loads(json.dumps(result))
+        more_memory_result['case_list'][0]['stage_list'][-1]['peak_rss_delta'] = stage['peak_rss_delta'] * 2 + 2 ** 20
+        regression_list = benchmark.compare_result(result, more_memory_result)
+        assert [(x['stage'], x['metric']) for x in regression_list] == [('category_dictionary', 'peak_rss_delta')], \
+            "memory regression is not reported"
+    # without the resource module, as on windows, the process peak is unknown
+    resource_module = sys.modules.get('resource')
+    sys.modules['resource'] = None
+    try:
+        assert benchmark.peak_rss() is None, "peak without the resource module is not correct"
+    finally:
+        if resource_module is None:
+            del sys.modules['resource']
+        else:
+            sys.modules['resource'] = resource_module
+    for name in os.listdir(data_dir):
+        os.remove(os.path.join(data_dir, name))
+    os.rmdir(data_dir)
+    print("finish testing benchmark")
+
+
+# test 24: stage metrics and profiling
+def test_stage_metrics() -> None:
+    print("\nstart testing stage metrics\n")
+    stage_list = []
+    metrics = solution.StageMetrics(callback=stage_list.append, trace_memory=True)
+    assert solution.main(default_csvfile, metrics=metrics) == solution.main(default_csvfile), \
+        "result with metrics is not correct"
+    assert [x['stage'] for x in metrics.get_stage_list()] == [
+        'read', 'validate', 'group country', 'statistics', 'group category', 'rank'], "stages are not correct"
+    assert stage_list == metrics.get_stage_list(), "callback is not called for each stage"
+    with open(default_csvfile, 'r') as f:
+        line_size = len(f.readlines())
+    assert metrics.get_stage('read')['rows_out'] == line_size, "read rows are not correct"
+    assert metrics.get_stage('validate')['rows_in'] == line_size - 1, "validate rows are not correct"
+    assert metrics.get_stage('rank')['rows_out'] == len(solution.main(default_csvfile)[1]), "rank rows are not correct"
+    assert all(x['wall_time'] >= 0 and 'memory_peak' in x for x in metrics.get_stage_list()), \
+        "measurements are not correct"
+    # profile and allocation snapshot of a single run
+    profile_file = "./main.prof"
+    snapshot_file = "./main.tracemalloc"
+    solution.profile_main(default_csvfile, profile_file=profile_file, snapshot_file=snapshot_file)
+    assert pstats.Stats(profile_file).total_calls > 0, "profile is not written"
+    assert len(tracemalloc.Snapshot.load(snapshot_file).traces) > 0, "allocation snapshot is not written"
+    os.remove(profile_file)
+    os.remove(snapshot_file)
+    print("finish testing stage metrics")
+
+
+# test 25: compact organisation id table
+def test_organisation_id_table() -> None:
+    print("\nstart testing organisation id table\n")
+    for bloom_size in [0, 4096]:
+        id_table = solution.OrganisationIdTable(capacity=16, bloom_size=bloom_size)
+        id_list = [''.join(random.choices(string.hexdigits.lower(), k=random.randint(1, 15))) for _ in range(3000)]
+        # leading zeros, non hex, too long and non ascii ids are told apart
+        id_list += ['0abc', 'abc', '00abc', 'xyz123', 'a' * 20, 'caf\u00e9']
+        id_list = list(dict.fromkeys(id_list))
+        # 'abc' is expected to be counted once, it is never sampled as a duplicate
+        duplicate_id_list = random.sample([x for x in id_list if x != 'abc'], 100) + ['0abc', 'xyz123', 'caf\u00e9']
+        for i in range(0, len(id_list), 500):
+            id_table.add_list(id_list[i:i + 500])
+        id_table.add_list(duplicate_id_list + duplicate_id_list[:10])
+        assert len(id_table) == len(id_list), "id count is not correct"
+        assert id_table.get_duplicate_set() == set(duplicate_id_list), "duplicate ids are not correct"
+        assert id_table.get_count('abc') == 1 and id_table.get_count('0abc') == 2, "id count is not correct"
+        assert 'abcd0123' not in id_table or 'abcd0123' in id_list, "unknown id is found"
+        # tables of two halves merged into one give the same duplicates
+        merged_table = solution.OrganisationIdTable()
+        for half_list in [id_list[:1500] + duplicate_id_list, id_list[1500:]]:
+            half_table = solution.OrganisationIdTable()
+            half_table.add_list(half_list)
+            merged_table.merge_entries(*half_table.get_entries())
+        assert merged_table.get_duplicate_set() == set(duplicate_id_list), "merged duplicate ids are not correct"
+    # duplicates are excluded from the rows without changing the result
+    with open(default_csvfile, 'r') as f:
+        read_data = f.readlines()
+    read_data += read_data[1:4] + ["{},invalid\n".format(read_data[5].split(',')[0])]
+    rejections = solution.RejectionReport()
+    data_list = solution.save_file_data(read_data, rejections)
+    expected_id_set = {x.split(',')[0].lower() for x in read_data[1:4] + read_data[5:6]}
+    assert len(data_list) == len(read_data) - 1 - 8 and not any(x['organisation id'] in expected_id_set
+                                                                for x in data_list), "duplicates are not excluded"
+    assert rejections.get_count('duplicate') == 7, "duplicate count is not correct"
+    # the columnar table excludes the same rows
+    rejections = solution.RejectionReport()
+    table = solution.fields_table(solution.iter_line_fields(read_data[1:], read_data[0].lower().strip().split(',')),
+                                  rejections)
+    assert table.get_organisation_id().tolist() == [x['organisation id'] for x in data_list], \
+        "table duplicates are not excluded"
+    assert rejections.get_count('duplicate') == 7, "table duplicate count is not correct"
+    assert solution.scan_duplicate_organisation_id(default_csvfile) == set(), "duplicates are not correct"
+    print("finish testing organisation id table")
+
+
+# test 26: external sort for category ranking
+def test_external_sort() -> None:
+    print("\nstart testing external sort\n")
+    # 7 organisations per run file
+    memory_size = 7 * CATEGORY_RUN_ITEM_SIZE
+    check_engine_files(lambda csvfile: solution.main_external(csvfile, memory_size=memory_size))
+    expected_result = solution.main(default_csvfile, top_k=3)
+    check_same_result(expected_result, solution.main_external(default_csvfile, memory_size=memory_size, top_k=3))
+    # ranks streamed to a csv file
+    output_file = "./external_sort.csv"
+    assert solution.main_external(default_csvfile, memory_size=memory_size, output_file=output_file)[1] == {}, \
+        "category_dict should be empty"
+    with open(output_file, 'r') as f:
+        row_list = list(csv.reader(f))[1:]
+    os.remove(output_file)
+    category_dict = solution.main(default_csvfile)[1]
+    assert len(row_list) == sum(len(x) for x in category_dict.values()), "row count is not correct"
+    for category, organisation_id, number_of_employees, profit_percent_change, rank in row_list:
+        assert category_dict[category][organisation_id] == [int(number_of_employees), float(profit_percent_change),
+                                                            int(rank)], "row:[{}] is not correct".format(organisation_id)
+    # runs are merged a few at a time, ties keep the insertion order
+    with solution.CategoryRunSorter(memory_size=3 * CATEGORY_RUN_ITEM_SIZE, fan_in=2) as category_sorter:
+        for i in range(40):
+            category_sorter.add("c{}".format(i % 2), "id{}".format(i), i % 3, 1.5)
+        ranked_list = list(category_sorter.iter_ranked())
+        assert category_sorter.get_run_count() > 14, "runs are not merged in several passes"
+    expected_list = []
+    for category in ["c0", "c1"]:
+        organisation_list = [("id{}".format(i), i % 3) for i in range(40) if "c{}".format(i % 2) == category]
+        organisation_list = sorted(organisation_list, key=lambda x: x[1], reverse=True)
+        expected_list += [(category, x[0], x[1], 1.5, rank) for rank, x in enumerate(organisation_list, 1)]
+    assert ranked_list == expected_list, "ranked organisations are not correct"
+    # the merge of many runs stays within the memory budget
+    memory_size = 256 * 1024
+    with solution.CategoryRunSorter(memory_size=memory_size) as category_sorter:
+        for i in range(20000):
+            category_sorter.add("c{}".format(i % 7), "{:015x}".format(random.getrandbits(60)), random.randint(1, 100),
+                                round(random.uniform(0, 100), 4))
+        start_tracing = not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+        ranked_size = sum(1 for _ in category_sorter.iter_ranked())
+        memory_peak = tracemalloc.get_traced_memory()[1] - memory_start
+        if start_tracing:
+            tracemalloc.stop()
+        assert ranked_size == 20000 and category_sorter.get_run_count() > 20, "runs are not merged"
+        assert memory_peak < memory_size, "merge peak:[{}] is over the memory budget".format(memory_peak)
+    # duplicated ids are found by an external sort of the id codes, runs are merged a few at a time
+    id_list = ["{:x}".format(random.getrandbits(random.randint(4, 60))) for _ in range(5000)] + ['xyz', 'caf\u00e9']
+    id_list += random.sample(id_list, 300) + ['xyz']
+    random.shuffle(id_list)
+    with solution.OrganisationIdSorter(memory_size=64 * 8, fan_in=2) as id_sorter:
+        for i in range(0, len(id_list), 700):
+            id_sorter.add_list(id_list[i:i + 700])
+        id_sorter.finish()
+        id_table = solution.OrganisationIdTable()
+        id_table.add_list(id_list)
+        assert id_sorter.get_run_count() > 100, "id runs are not merged in several passes"
+        assert id_sorter.get_duplicate_size() == id_table.get_duplicate_size(), "duplicate size is not correct"
+        assert [x for x in id_list + ['abc123'] if x in id_sorter] == \
+               [x for x in id_list + ['abc123'] if id_table.get_count(x) > 1], "duplicate ids are not correct"
+    # the id scan of main_external does not grow with the rows
+    external_file = "./external_sort.csv"
+    memory_size = 1024 * 1024
+    memory_peak_list = []
+    for size in [10000, 40000]:
+        generator.generate_csv(external_file, size, seed=size, duplicate_rate=0.2, invalid_rate=0.05)
+        start_tracing = not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+        with solution.OrganisationIdSorter(memory_size=memory_size) as id_sorter:
+            solution.sort_organisation_id(solution.iter_mmap_fields(external_file), id_sorter, 4096)
+        memory_peak_list.append(tracemalloc.get_traced_memory()[1] - memory_start)
+        if start_tracing:
+            tracemalloc.stop()
+    check_same_result(solution.main(external_file), solution.main_external(external_file, memory_size=64 * 1024))
+    os.remove(external_file)
+    assert memory_peak_list[1] < memory_peak_list[0] * 1.25, "id scan peak:{} grows with the rows".format(
+        memory_peak_list)
+    print("finish testing external sort")
+
+
+# test 27: asyncio query server
+def test_query_server() -> None:
+    print("\nstart testing query server\n")
+    server_file = "./query_server.csv"
+    with open(default_csvfile, 'r') as f:
+        read_data = f.readlines()
+    with open(server_file, 'w') as f:
+        f.writelines(read_data[:300])
+
+    async def request(port, target):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write("GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n".format(target).encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, body = response.split(b"\r\n\r\n", 1)
+        return int(head.split()[1]), json.loads(body)
+
+    async def run():
+        query_server = server.QueryServer(server_file, port=0, poll_interval=0.05)
+        await query_server.start()
+        try:
+            country_dict, category_dict = solution.main(server_file)
+            country = next(iter(country_dict))
+            category = next(iter(category_dict))
+            target_list = ["/country/{}".format(quote(country)), "/category/{}?top=2".format(quote(category)),
+                           "/category/{}".format(quote(category)), "/country/unknown",
+                           "/category/{}?top=x".format(quote(category))]
+            response_list = await asyncio.gather(*[request(query_server.get_port(), x) for x in target_list * 4])
+            status, payload = response_list[0]
+            assert status == 200 and [payload['t_test_score'], payload['minkowski_distance']] == \
+                country_dict[country], "country response is not correct"
+            status, payload = response_list[1]
+            assert status == 200 and [x['organisation id'] for x in payload['organisation_list']] == \
+                list(category_dict[category])[:2], "category top response is not correct"
+            assert len(response_list[2][1]['organisation_list']) == len(category_dict[category]), \
+                "category response is not correct"
+            assert response_list[3][0] == 404 and response_list[4][0] == 400, "error status is not correct"
+            assert response_list[:5] == response_list[5:10], "concurrent responses are not the same"
+            status, payload = await request(query_server.get_port(), "//[::1/country/{}".format(quote(country)))
+            assert status == 400, "malformed target status is not correct"
+            # request and header lines longer than the stream limit
+            for target, header in [("/" + "x" * 70000, ""), ("/country/x", "X-Long: {}\r\n".format("x" * 70000))]:
+                reader, writer = await asyncio.open_connection('127.0.0.1', query_server.get_port())
+                writer.write("GET {} HTTP/1.1\r\n{}\r\n".format(target, header).encode())
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                assert int(response.split()[1]) == 400, "long line status is not correct"
+            # a changed file is recomputed in the background and swapped in as a whole
+            old_state = query_server.state
+            with open(server_file, 'a') as f:
+                f.writelines(read_data[300:])
+            for _ in range(200):
+                if query_server.state is not old_state:
+                    break
+                await asyncio.sleep(0.05)
+            country_dict = solution.main(server_file)[0]
+            assert query_server.state[1] == country_dict, "changed file is not recomputed"
+            status, payload = await request(query_server.get_port(), "/country/{}".format(quote(country)))
+            assert [payload['t_test_score'], payload['minkowski_distance']] == country_dict[country], \
+                "country response is not updated"
+        finally:
+            await query_server.close()
+
+    asyncio.run(run())
+    os.remove(server_file)
+    print("finish testing query server")
+
+
 def test() -> None:
     test_one_case()
     test_special_files()